@@ -0,0 +1,54 @@
+"""Compare the commit paths of the store.
+
+Usage: python -m benchmarks.bench_commit [COMMITS]
+
+Adds COMMITS datapoints (50 by default), one commit each, to a goal of
+stores with 10 and 1000 goals, once committing straight into the object
+database and once through GitPython's index, and prints the commits per
+second of both. The last column shows the updates per second when the
+commits are left to the background queue, including its final flush.
+"""
+import shutil
+import sys
+import tempfile
+import time
+
+from habit.goal import create_goal, create_point
+from habit.store import DataStore
+
+STORE_SIZES = (10, 1000)
+
+
+def commits_per_second(goals, commits, fastcommit, background=False):
+    path = tempfile.mkdtemp()
+    try:
+        store = DataStore.init(path)
+        with store.transaction():
+            for i in range(goals):
+                create_goal(
+                    name='goal{}'.format(i), daily_slope=1,
+                    pledge=0).set_store(store)
+        store = DataStore(path, fastcommit=fastcommit, background=background)
+        goal = store.load_goal('goal0')
+        start = time.perf_counter()
+        for _ in range(commits):
+            goal.add_point(create_point(value=1))
+        store.close()
+        return commits / (time.perf_counter() - start)
+    finally:
+        shutil.rmtree(path)
+
+
+def run(commits):
+    print('{:<8}{:>18}{:>18}{:>18}'.format('goals', 'index [1/s]',
+                                           'object db [1/s]',
+                                           'background [1/s]'))
+    for goals in STORE_SIZES:
+        print('{:<8}{:>18.1f}{:>18.1f}{:>18.1f}'.format(
+            goals, commits_per_second(goals, commits, False),
+            commits_per_second(goals, commits, True),
+            commits_per_second(goals, commits, True, True)))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,81 @@
+"""Stress the store with writers running in parallel processes.
+
+Usage: python -m benchmarks.bench_concurrency [WRITERS] [POINTS_PER_WRITER]
+
+Starts WRITERS processes (4 by default) that each add POINTS_PER_WRITER
+datapoints (10 by default), once all to the same goal and once each to a
+goal of its own. Prints the throughput of both runs and exits with status
+1 if any point got lost.
+"""
+import datetime as dt
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import time
+
+from habit.goal import Goal, create_goal, create_point
+from habit.store import DataStore
+
+
+def write_points(path, name, count):
+    store = DataStore(path)
+    for i in range(count):
+        store.load_goal(name).add_point(
+            create_point(value=1, stamp=dt.datetime(2019, 6, 18) +
+                         dt.timedelta(minutes=i)))
+
+
+def run_writers(writers, points, goals):
+    """Add the points with writers processes to goals goals.
+
+    Returns the seconds it took and the number of points that arrived.
+    """
+    path = tempfile.mkdtemp()
+    try:
+        store = DataStore.init(path)
+        names = ['goal{}'.format(i) for i in range(goals)]
+        with store.transaction():
+            for name in names:
+                create_goal(name=name, daily_slope=1, pledge=0).set_store(
+                    store)
+        processes = [
+            multiprocessing.Process(
+                target=write_points, args=(path, names[i % goals], points))
+            for i in range(writers)
+        ]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        seconds = time.perf_counter() - start
+        arrived = sum(
+            len(Goal.fromYAML(store.get_path_to_goal(name)).datapoints)
+            for name in names)
+        return seconds, arrived
+    finally:
+        shutil.rmtree(path)
+
+
+def run(writers, points):
+    lost = False
+    print('{} writers adding {} points each'.format(writers, points))
+    print('{:<12}{:>10}{:>10}{:>12}'.format('goals', 'time [s]', 'points',
+                                            'points/s'))
+    for goals in sorted({1, writers}):
+        seconds, arrived = run_writers(writers, points, goals)
+        print('{:<12}{:>10.2f}{:>10}{:>12.1f}'.format(
+            goals, seconds, arrived, arrived / seconds))
+        lost = lost or arrived != writers * points
+    if lost:
+        print('points got lost')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(
+        run(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 10))
@@ -0,0 +1,49 @@
+"""Measure how long importing the habit command line interface takes.
+
+Usage: python -m benchmarks.bench_startup [THRESHOLD_MS]
+
+Runs ``python -X importtime -c 'import habit.cli'`` a few times, prints the
+best cumulative import time of habit.cli and the heavy dependencies that
+were imported, and exits with status 1 if the time exceeds the threshold
+(150 ms by default).
+"""
+import subprocess
+import sys
+
+RUNS = 5
+DEFAULT_THRESHOLD_MS = 150
+HEAVY_MODULES = ('dateparser', 'git', 'tabulate', 'yaml', 'dateutil',
+                 'numpy')
+
+
+def import_times():
+    """Cumulative import time in microseconds of each top level module."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import habit.cli'],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def run(threshold_ms):
+    runs = [import_times() for _ in range(RUNS)]
+    best = min(times['habit.cli'] for times in runs) / 1000
+    heavy = sorted(name for name in runs[0] if name in HEAVY_MODULES)
+    print('import habit.cli: {:.1f} ms (best of {})'.format(best, RUNS))
+    print('heavy modules imported: {}'.format(', '.join(heavy) or 'none'))
+    if best > threshold_ms:
+        print('slower than the threshold of {} ms'.format(threshold_ms))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(
+        run(float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_THRESHOLD_MS))
@@ -0,0 +1,68 @@
+"""Compare load and dump times of the goal YAML layouts.
+
+Usage: python -m benchmarks.bench_yaml [NUMBER_OF_POINTS]
+"""
+import datetime as dt
+import os
+import sys
+import tempfile
+import time
+
+import yaml
+
+from habit import goal as goal_module
+from habit.goal import Goal, create_goal, create_point
+
+
+def synthetic_goal(size):
+    goal = create_goal(name='bench', daily_slope=1, pledge=0)
+    start = dt.datetime(2019, 6, 18)
+    for i in range(size):
+        goal.add_point(
+            create_point(
+                stamp=start + dt.timedelta(minutes=i),
+                value=float(i % 7),
+                comment='' if i % 10 else 'comment'))
+    return goal
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(size):
+    goal = synthetic_goal(size)
+    path = tempfile.mkstemp(suffix='.yaml')[1]
+    c_classes = goal_module.yaml_classes()
+
+    class PureGoalDumper(yaml.SafeDumper):
+        pass
+
+    PureGoalDumper.add_representer(goal_module.Row, goal_module.represent_row)
+    pure_classes = (yaml, yaml.SafeLoader, PureGoalDumper)
+    results = []
+    try:
+        for label, classes, compact in [
+            ('pure python, mappings', pure_classes, False),
+            ('libyaml, mappings', c_classes, False),
+            ('libyaml, compact rows', c_classes, True),
+        ]:
+            goal_module._yaml = classes
+            dump = timed(lambda: goal.toYAML(path, compact=compact))
+            load = timed(lambda: Goal.fromYAML(path))
+            results.append((label, dump, load, os.path.getsize(path)))
+    finally:
+        goal_module._yaml = c_classes
+        os.remove(path)
+    print('{} datapoints'.format(size))
+    print('{:<24}{:>10}{:>10}{:>12}'.format(
+        'layout', 'dump [s]', 'load [s]', 'size [B]'))
+    for label, dump, load, file_size in results:
+        print('{:<24}{:>10.2f}{:>10.2f}{:>12}'.format(
+            label, dump, load, file_size))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
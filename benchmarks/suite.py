@@ -0,0 +1,295 @@
+"""Benchmark the hot paths of goals and stores as the data grows.
+
+Usage: python -m benchmarks.suite [--quick] [-k PATTERN] [-o FILE]
+                                  [--compare FILE]
+
+Each benchmark runs one operation on synthetic data at several scales:
+points per goal (1 to 100k) or goals per store (1 to 5k, 10 points each).
+The operation is repeated until it took --min-time seconds in total and
+at least 3 times. The median latency, the throughput and the peak memory
+allocated by one run, traced with tracemalloc, are printed and saved as
+JSON to benchmarks/results/<commit>.json unless -o names another file.
+
+--compare prints the change of the median latency relative to an earlier
+results file and exits with status 1 if any benchmark got slower than
+--threshold times the earlier latency. Stores are written to temporary
+git repositories; nothing needs the network. The data of a benchmark is
+kept between its repeats, so caches are warm after the first one.
+"""
+import argparse
+from collections import namedtuple
+import datetime as dt
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import START, synthetic_goal, synthetic_store
+from habit.goal import Goal, add_point_to_sorted_tuple, create_point
+
+POINT_SCALES = (1, 100, 10000, 100000)
+GOAL_SCALES = (1, 100, 1000, 5000)
+QUICK_POINT_SCALES = (1, 100, 10000)
+QUICK_GOAL_SCALES = (1, 100)
+POINTS_PER_GOAL = 10
+MIN_REPEATS = 3
+MAX_REPEATS = 10000
+
+Benchmark = namedtuple('Benchmark', ['name', 'axis', 'setup'])
+
+BENCHMARKS = []
+
+
+def benchmark(name, axis):
+    """Register the decorated setup as a benchmark at the scales of axis.
+
+    The setup is called with the scale and a temporary directory and
+    returns the operation to time, a function of no arguments.
+    """
+
+    def register(setup):
+        BENCHMARKS.append(Benchmark(name, axis, setup))
+        return setup
+
+    return register
+
+
+def middle_stamp(goal):
+    """A stamp in the middle of the datapoints of goal."""
+    if not len(goal.datapoints):
+        return START
+    return goal.datapoints[len(goal.datapoints) // 2].stamp + dt.timedelta(
+        seconds=1)
+
+
+@benchmark('add_point_to_sorted_tuple', 'points')
+def setup_sorted_tuple(points, directory):
+    goal = synthetic_goal(points)
+    datapoints = tuple(goal.datapoints)
+    point = create_point(value=1, stamp=middle_stamp(goal))
+    return lambda: add_point_to_sorted_tuple(datapoints, point)
+
+
+@benchmark('Goal.add_point', 'points')
+def setup_add_point(points, directory):
+    goal = synthetic_goal(points)
+    stamp = middle_stamp(goal)
+    return lambda: goal.add_point(create_point(value=1, stamp=stamp))
+
+
+@benchmark('Goal.find_datapoint', 'points')
+def setup_find_datapoint(points, directory):
+    goal = synthetic_goal(points)
+    prefix = goal.datapoints[len(goal.datapoints) // 2].uuid[:8]
+    return lambda: goal.find_datapoint(prefix)
+
+
+@benchmark('Goal.time_remaining', 'points')
+def setup_time_remaining(points, directory):
+    goal = synthetic_goal(points)
+    now = START + dt.timedelta(days=30)
+    return lambda: goal.time_remaining(now)
+
+
+@benchmark('Goal.rollup', 'points')
+def setup_rollup(points, directory):
+    goal = synthetic_goal(points)
+    return lambda: goal.rollup('day')
+
+
+@benchmark('Goal.toYAML', 'points')
+def setup_to_yaml(points, directory):
+    goal = synthetic_goal(points)
+    path = os.path.join(directory, 'goal.yaml')
+    return lambda: goal.toYAML(path)
+
+
+@benchmark('Goal.fromYAML', 'points')
+def setup_from_yaml(points, directory):
+    path = os.path.join(directory, 'goal.yaml')
+    synthetic_goal(points).toYAML(path)
+    return lambda: Goal.fromYAML(path)
+
+
+@benchmark('DataStore.update_goal', 'points')
+def setup_update_goal_points(points, directory):
+    store = synthetic_store(directory, 1, points)
+    goal = store.load_goal('goal0')
+    return lambda: goal.add_point(create_point(value=1))
+
+
+@benchmark('DataStore.update_goal', 'goals')
+def setup_update_goal_goals(goals, directory):
+    store = synthetic_store(directory, goals, POINTS_PER_GOAL)
+    goal = store.load_goal('goal0')
+    return lambda: goal.add_point(create_point(value=1))
+
+
+@benchmark('DataStore.goal_summaries', 'goals')
+def setup_goal_summaries(goals, directory):
+    synthetic_store(directory, goals, POINTS_PER_GOAL)
+    from habit.store import DataStore
+    return lambda: DataStore(directory).goal_summaries()
+
+
+@benchmark('cli.load_goals', 'goals')
+def setup_load_goals(goals, directory):
+    synthetic_store(directory, goals, POINTS_PER_GOAL)
+    from habit import cli
+
+    def load_goals():
+        # Runs in the store like the command line does.
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            return cli.load_goals()
+        finally:
+            os.chdir(cwd)
+
+    return load_goals
+
+
+def measure(run, min_time):
+    """Time run and trace the memory it allocates."""
+    latencies = []
+    total = 0
+    while len(latencies) < MAX_REPEATS and (len(latencies) < MIN_REPEATS
+                                            or total < min_time):
+        start = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - start)
+        total += latencies[-1]
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    median = statistics.median(latencies)
+    return {
+        'repeats': len(latencies),
+        'median': median,
+        'min': min(latencies),
+        'mean': statistics.mean(latencies),
+        'ops_per_second': 1 / median if median else None,
+        'peak_memory': peak,
+    }
+
+
+def current_commit():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=root,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmarks(pattern, quick, min_time):
+    scales = {
+        'points': QUICK_POINT_SCALES if quick else POINT_SCALES,
+        'goals': QUICK_GOAL_SCALES if quick else GOAL_SCALES,
+    }
+    for bench in BENCHMARKS:
+        if pattern and not fnmatch.fnmatch(bench.name, pattern):
+            continue
+        for scale in scales[bench.axis]:
+            directory = tempfile.mkdtemp()
+            try:
+                run = bench.setup(scale, directory)
+                result = measure(run, min_time)
+            finally:
+                shutil.rmtree(directory)
+            result.update(name=bench.name, axis=bench.axis, scale=scale)
+            yield result
+
+
+def key(result):
+    return '{} {}={}'.format(result['name'], result['axis'],
+                             result['scale'])
+
+
+def format_duration(seconds):
+    for unit, factor in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * factor >= 1:
+            return '{:.2f} {}'.format(seconds * factor, unit)
+    return '{:.0f} ns'.format(seconds * 1e9)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.suite',
+        description='Benchmark the hot paths of goals and stores.')
+    parser.add_argument('--quick', action='store_true',
+                        help='skip the largest scales')
+    parser.add_argument('-k', dest='pattern', default=None,
+                        help='only run benchmarks matching this glob')
+    parser.add_argument('-o', '--output', default=None,
+                        help='JSON file the results are saved to')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown reported as a regression')
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='seconds each benchmark runs at least')
+    args = parser.parse_args(args)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {key(r): r for r in json.load(f)['results']}
+    commit = current_commit()
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results',
+        '{}.json'.format(commit))
+
+    print('{:<48}{:>12}{:>14}{:>12}{:>10}'.format('benchmark', 'median',
+                                                  'ops/s', 'peak [kB]',
+                                                  'change'))
+    results = []
+    regressions = []
+    for result in run_benchmarks(args.pattern, args.quick, args.min_time):
+        results.append(result)
+        change = ''
+        before = baseline.get(key(result))
+        if before is not None and before['median']:
+            ratio = result['median'] / before['median']
+            change = '{:+.0%}'.format(ratio - 1)
+            if ratio > args.threshold:
+                regressions.append(key(result))
+        print('{:<48}{:>12}{:>14.1f}{:>12.1f}{:>10}'.format(
+            key(result), format_duration(result['median']),
+            result['ops_per_second'] or 0, result['peak_memory'] / 1024,
+            change))
+        sys.stdout.flush()
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'date': dt.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+            'quick': args.quick,
+            'results': results
+        }, f, indent=2)
+    print('Results saved to {}'.format(output))
+    if regressions:
+        print('More than {:.2f}x slower than in {}: {}'.format(
+            args.threshold, args.compare, ', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Generate goals and stores of a given size for the benchmarks.
+
+The content only depends on the seed, so runs at different commits
+measure the same data.
+"""
+import datetime as dt
+import random
+import uuid
+
+from habit.goal import Goal, Point
+from habit.store import DataStore
+
+START = dt.datetime(2019, 1, 1)
+
+
+def synthetic_points(count, seed=0):
+    """count points, about one per 10 minutes from START, every tenth with
+    a comment."""
+    rng = random.Random(seed)
+    return [
+        Point(
+            stamp=START + dt.timedelta(minutes=10 * i + rng.randrange(10)),
+            value=float(rng.randrange(1, 10)),
+            comment='' if i % 10 else 'comment {}'.format(i),
+            uuid=str(uuid.UUID(int=rng.getrandbits(128), version=4)))
+        for i in range(count)
+    ]
+
+
+def synthetic_goal(points, name='bench', seed=0):
+    """A goal with points datapoints and a reference line above them."""
+    reference_points = (
+        Point(stamp=START, value=0.0, comment='', uuid=str(uuid.UUID(int=1))),
+        Point(
+            stamp=START + dt.timedelta(days=3650),
+            value=3650.0 * 144 * 5,
+            comment='',
+            uuid=str(uuid.UUID(int=2))),
+    )
+    return Goal(
+        name=name,
+        pledge=0,
+        reference_points=reference_points,
+        datapoints=synthetic_points(points, seed))
+
+
+def synthetic_store(path, goals, points, **options):
+    """Initialize a store at path with goals goals of points points each.
+
+    The goals are written with a single commit. options are passed on to
+    DataStore, e.g. shard=True.
+    """
+    DataStore.init(path)
+    store = DataStore(path, **options)
+    store.import_goals(
+        (synthetic_goal(points, name='goal{}'.format(i), seed=i)
+         for i in range(goals)), 'Synthetic goals')
+    return store
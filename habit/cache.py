@@ -0,0 +1,200 @@
+from collections import OrderedDict
+from hashlib import sha1
+import os
+import pickle
+import tempfile
+
+# Part of every disk cache key, bump it whenever Goal or the points change
+# what they pickle, so pickles of older versions are never read.
+CACHE_FORMAT = 3
+
+
+def blob_sha(data):
+    """The id git gives a blob with the given content."""
+    header = 'blob {}\0'.format(len(data)).encode()
+    return sha1(header + data).hexdigest()
+
+
+def file_stat(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_sha(path):
+    try:
+        with open(path, 'rb') as f:
+            return blob_sha(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def files_sha(paths):
+    return tuple(file_sha(path) for path in paths)
+
+
+class BlobCache():
+    """Parsed git objects in memory, keyed by their id.
+
+    Objects are parsed once per parse function and dropped least recently
+    used first once there are more than capacity. The parsed values are
+    shared, callers must not modify them.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+
+    def get(self, binsha, parse):
+        """Return parse(binsha), calling it only on a miss."""
+        key = (binsha, parse)
+        try:
+            value = self._entries[key]
+        except KeyError:
+            value = self._entries[key] = parse(binsha)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class GoalCache():
+    """Parsed goals cached in memory and on disk.
+
+    Goals are cached under their name together with the paths of the
+    files they are read from. The in-memory level holds the most recently
+    used goals and is validated by the modification time and size of
+    those files. The on-disk level pickles goals into directory, keyed by
+    the git blob ids of the files, and drops the least recently used
+    pickles once they take more than max_bytes. Without a directory only
+    the in-memory level is used.
+
+    Cached goals are copied on the way in and out, so callers can modify
+    the goals they get. The blob ids of the files a goal was read from
+    are kept with it, see blob_shas.
+    """
+
+    def __init__(self, directory, capacity=64, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+
+    def get(self, name, paths, parse):
+        """Return the goal stored in paths, calling parse on a miss."""
+        stats = tuple(file_stat(path) for path in paths)
+        entry = self._memory.get(name)
+        if entry is not None and entry[0] == stats:
+            self._memory.move_to_end(name)
+            return entry[2].copy()
+        shas = files_sha(paths)
+        key = self._key(shas)
+        goal = self._read(key)
+        if goal is None:
+            goal = parse()
+            self._write(key, goal)
+        self._remember(name, stats, shas, goal)
+        return goal.copy()
+
+    def put(self, name, paths, goal):
+        """Cache goal as the current content of paths in memory.
+
+        The disk level is left alone, pickling every write would cost more
+        than the write itself. A new process pickles the goal on its first
+        miss instead.
+        """
+        stats = tuple(file_stat(path) for path in paths)
+        self._remember(name, stats, files_sha(paths), goal.copy())
+
+    def blob_shas(self, name):
+        """Blob ids of the files the cached goal named name was read from."""
+        entry = self._memory.get(name)
+        return None if entry is None else entry[1]
+
+    def clear(self):
+        self._memory.clear()
+        for entry in self._entries():
+            _remove(entry.path)
+
+    def _key(self, shas):
+        key = ':'.join([str(CACHE_FORMAT)] + [sha or '' for sha in shas])
+        return sha1(key.encode()).hexdigest()
+
+    def _remember(self, name, stats, shas, goal):
+        self._memory[name] = (stats, shas, goal)
+        self._memory.move_to_end(name)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{}.pickle'.format(key))
+
+    def _read(self, key):
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                # Copying touches the attributes a stale pickle would lack.
+                goal = pickle.load(f).copy()
+            os.utime(path)
+            return goal
+        except FileNotFoundError:
+            return None
+        except Exception:
+            _remove(path)
+            return None
+
+    def _write(self, key, goal):
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(goal, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path, self._path(key))
+        self._evict()
+
+    def _entries(self):
+        if self.directory is None:
+            return []
+        try:
+            return [
+                entry for entry in os.scandir(self.directory)
+                if entry.name.endswith('.pickle')
+            ]
+        except FileNotFoundError:
+            return []
+
+    def _evict(self):
+        # Other processes share the directory and may remove entries any
+        # time, those are skipped.
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append((entry.stat(), entry))
+            except FileNotFoundError:
+                pass
+        total = sum(stat.st_size for stat, _ in entries)
+        entries.sort(key=lambda e: e[0].st_mtime_ns)
+        for stat, entry in entries:
+            if total <= self.max_bytes:
+                break
+            _remove(entry.path)
+            total -= stat.st_size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,29 +1,122 @@
 # -*- coding: utf-8 -*-
 """Console script for habit."""
 import click
-from habit.store import DataStore
+from contextlib import redirect_stderr, redirect_stdout
+from habit.daemon import FORWARDED_COMMANDS, forward
+from habit.store import DataStore, load_store, migrate as migrate_store
 from habit.goal import create_goal, create_point
+from habit.importer import FORMATS, guess_format, read_points
+from habit.rollup import PERIODS
+import io
 import os
-import tabulate
-import multiprocessing.dummy
 import sys
+import time
 import datetime as dt
-from dateparser import parse as dparse
 
+# Heavy dependencies (dateparser, tabulate, GitPython, PyYAML, dateutil)
+# are imported inside the commands that need them to keep startup fast.
 
-@click.group()
+
+class HabitGroup(click.Group):
+    """Forwards commands to a running daemon, if there is one."""
+
+    def main(self, args=None, **kwargs):
+        if args is None:
+            args = sys.argv[1:]
+        args = tuple(args)
+        if (kwargs.get('obj') is None and args
+                and args[0] in FORWARDED_COMMANDS):
+            try:
+                response = forward(os.getcwd(), args)
+            except RuntimeError as e:
+                sys.stderr.write('{}\n'.format(e))
+                sys.exit(1)
+            if response is not None:
+                sys.stdout.write(response['output'])
+                sys.exit(response['exit_code'])
+        return super().main(args=args, **kwargs)
+
+
+@click.group(cls=HabitGroup)
 def main(args=None):
     pass
 
 
+def open_store():
+    """The store served by the daemon, or the one in the current directory."""
+    context = click.get_current_context(silent=True)
+    if context is not None and context.obj is not None:
+        return context.obj
+    return load_store(os.getcwd())
+
+
+def run_command(args, store):
+    """Run a command line against store, return its output and exit code."""
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output), redirect_stderr(output):
+            main.main(
+                args=args, prog_name='habit', obj=store,
+                standalone_mode=False)
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else int(
+            e.code is not None)
+    except click.ClickException as e:
+        e.show(file=output)
+        exit_code = e.exit_code
+    except Exception as e:
+        output.write('{}: {}\n'.format(type(e).__name__, e))
+        exit_code = 1
+    return output.getvalue(), exit_code
+
+
+BACKENDS = ('git', 'sqlite')
+
+
+def store_class(backend):
+    if backend == 'sqlite':
+        from habit.sqlstore import SQLiteStore
+        return SQLiteStore
+    return DataStore
+
+
 @main.command()
-def init():
+@click.option(
+    '-b',
+    '--backend',
+    'backend',
+    type=click.Choice(BACKENDS),
+    default='git',
+    help='Store goals as YAML files in git or in an SQLite database')
+def init(backend):
     try:
-        DataStore.init(os.getcwd())
+        store_class(backend).init(os.getcwd())
         print('Habit Store initialized successfully!')
     except FileExistsError as e:
         print(e)
-        exit(1)
+        sys.exit(1)
+
+
+@main.command()
+@click.argument('target', type=click.Path(file_okay=False))
+@click.option(
+    '-b',
+    '--backend',
+    'backend',
+    type=click.Choice(BACKENDS),
+    required=True,
+    help='Backend of the new store')
+def migrate(target, backend):
+    """Copy all goals into a new store in the TARGET directory."""
+    store = open_store()
+    try:
+        new_store = store_class(backend).init(target)
+        count = migrate_store(store, new_store)
+    except (FileExistsError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+    print('Migrated {} goals to {}'.format(count, target))
 
 
 @main.command()
@@ -36,7 +129,7 @@ def init():
     default=3,
     help='Number of flat days in the beginning')
 def new(name, slope, pledge, initial_pause):
-    store = DataStore(os.getcwd())
+    store = open_store()
     goal = create_goal(
         name=name,
         daily_slope=slope,
@@ -49,32 +142,44 @@ def new(name, slope, pledge, initial_pause):
             .format(name, slope, pledge))
     except ValueError as e:
         print(e)
-        exit(1)
+        sys.exit(1)
 
 
 @main.command()
 def goals():
-    goals = load_goals()
+    store = open_store()
+    now = dt.datetime.now()
     table = [[goal.name, goal.pledge,
-              goal.time_remaining(dt.datetime.now())] for goal in goals]
+              goal.time_remaining(now)] for goal in store.goal_summaries()]
+    import tabulate
     print(tabulate.tabulate(table))
 
 
-def load_goal(store, name):
+def load_goal(store, name, at=None, since=None, until=None):
+    """The goal named name, as of at if given.
+
+    at names a commit, or a date if it does not. since and until allow the
+    store to load only the datapoints in that range.
+    """
     try:
-        return store.load_goal(name)
-    except KeyError as e:
+        if at is None:
+            return store.load_goal(name, since=since, until=until)
+        try:
+            return store.load_goal(name, at=at)
+        except ValueError:
+            from dateparser import parse as dparse
+            stamp = dparse(at)
+            if stamp is None:
+                raise
+            return store.load_goal(name, at=stamp)
+    except (KeyError, ValueError) as e:
         print(e)
-        exit(1)
+        sys.exit(1)
 
 
 def load_goals():
-    store = DataStore(os.getcwd())
-    names = store.list_goal_names()
-    if not names:
-        return []
-    pool = multiprocessing.dummy.Pool(len(names))
-    return pool.map(lambda name: store.load_goal(name), names)
+    store = open_store()
+    return [goal for goal in store.load_goals()]
 
 
 @main.command()
@@ -82,36 +187,195 @@ def load_goals():
 @click.argument('value')
 @click.option('-c', 'comment', default='', help='Comment for the datapoint')
 def add(name, value, comment=''):
-    store = DataStore(os.getcwd())
+    store = open_store()
     goal = load_goal(store, name)
     point = create_point(value=float(value), comment=comment)
     goal.add_point(point)
     print('Point added successfully!')
 
 
-@main.command()
+@main.command(name='import')
 @click.argument('name')
-def list(name):
-    store = DataStore(os.getcwd())
+@click.argument('file', type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '-f',
+    '--format',
+    'fmt',
+    type=click.Choice(FORMATS),
+    default=None,
+    help='Format of the file, guessed from its extension by default')
+def import_points(name, file, fmt):
+    """Import datapoints with stamp, value and comment from CSV or JSONL."""
+    store = open_store()
     goal = load_goal(store, name)
+    start = time.perf_counter()
+    count = len(goal.datapoints)
+    try:
+        with open(file, newline='') as f:
+            goal.add_points(read_points(f, fmt or guess_format(file)))
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    count = len(goal.datapoints) - count
+    seconds = time.perf_counter() - start
+    print('Imported {} points in {:.2f}s ({:.0f} points/s)'.format(
+        count, seconds, count / seconds if seconds else 0))
+
+
+@main.command()
+@click.option(
+    '--flush-interval',
+    'flush_interval',
+    default=1.0,
+    help='Seconds after which buffered changes are committed')
+@click.option(
+    '--batch-size',
+    'batch_size',
+    default=100,
+    help='Number of buffered changes that are committed at once')
+def serve(flush_interval, batch_size):
+    """Keep the goals in memory and serve commands over a Unix socket."""
+    from habit.daemon import Daemon
+    store = open_store()
+    daemon = Daemon(store, run_command, flush_interval, batch_size)
+    print('Serving {} on {}'.format(store.path, daemon.path))
+    sys.stdout.flush()
+    try:
+        daemon.serve_forever()
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+
+@main.group()
+def cache():
+    pass
+
+
+@cache.command()
+def clear():
+    store = open_store()
+    store.clear_cache()
+    print('Cache cleared successfully!')
+
+
+LIST_FORMATS = ('table', 'tsv', 'jsonl')
+
+
+def parse_date(option, value):
+    if value is None:
+        return None
+    from dateparser import parse as dparse
+    stamp = dparse(value)
+    if stamp is None:
+        raise click.BadParameter(
+            'Cannot read {} as a date'.format(value), param_hint=option)
+    return stamp
+
+
+def write_points(points, fmt):
+    """Print points one row at a time as TSV or JSON lines."""
+    if fmt == 'jsonl':
+        import json
+        for p in points:
+            print(json.dumps({
+                'stamp': p.stamp.isoformat(),
+                'value': p.value,
+                'comment': p.comment,
+                'uuid': p.uuid
+            }))
+        return
+    import csv
+    writer = csv.writer(sys.stdout, delimiter='\t', lineterminator='\n')
+    writer.writerow(['uuid', 'value', 'stamp', 'comment'])
+    for p in points:
+        writer.writerow([p.uuid, p.value, p.stamp.isoformat(), p.comment])
+
+
+@main.command()
+@click.argument('name')
+@click.option(
+    '--at',
+    'at',
+    default=None,
+    help='List the points as of a commit or a date, e.g. "2 weeks ago"')
+@click.option('--since', 'since', default=None, help='Skip earlier points')
+@click.option('--until', 'until', default=None, help='Skip later points')
+@click.option(
+    '--offset',
+    'offset',
+    type=click.IntRange(min=0),
+    default=0,
+    help='Number of points to skip')
+@click.option(
+    '--limit',
+    'limit',
+    type=click.IntRange(min=0),
+    default=None,
+    help='Maximum number of points to list')
+@click.option(
+    '--reverse', 'reverse', is_flag=True, help='List the latest points first')
+@click.option(
+    '-f',
+    '--format',
+    'fmt',
+    type=click.Choice(LIST_FORMATS),
+    default='table',
+    help='Output format, tsv and jsonl are written as the points are read')
+def list(name, at, since, until, offset, limit, reverse, fmt):
+    since = parse_date('--since', since)
+    until = parse_date('--until', until)
+    store = open_store()
+    goal = load_goal(store, name, at, since, until)
+    points = goal.datapoints.page(since, until, offset, limit, reverse)
+    if fmt != 'table':
+        write_points(points, fmt)
+        return
     table = [[d.uuid[:8], d.value,
-              d.stamp.isoformat(), d.comment] for d in goal.datapoints]
+              d.stamp.isoformat(), d.comment] for d in points]
+    import tabulate
     print(
         tabulate.tabulate(table, headers=['Hash', 'Value', 'Time', 'Comment']))
 
 
+@main.command()
+@click.argument('name')
+@click.option(
+    '--by',
+    'by',
+    type=click.Choice(PERIODS),
+    default='day',
+    help='Period the points are summed up by')
+def stats(name, by):
+    """Sum, count and mean of the points per period and the running value
+    against the reference line."""
+    store = open_store()
+    goal = load_goal(store, name)
+    table = [[
+        r.start.isoformat(), r.count, r.sum, r.mean, r.cumulative, r.target,
+        None if r.target is None else r.cumulative - r.target
+    ] for r in goal.rollup(by)]
+    import tabulate
+    print(
+        tabulate.tabulate(
+            table,
+            headers=['Period', 'Count', 'Sum', 'Mean', 'Value', 'Target',
+                     'Ahead'],
+            floatfmt='.2f'))
+
+
 @main.command()
 @click.argument('name')
 @click.argument('uuid')
 def remove(name, uuid):
-    store = DataStore(os.getcwd())
+    store = open_store()
     goal = load_goal(store, name)
     try:
         goal.remove_point(uuid)
         print('Point with uuid {} removed successfully!'.format(uuid))
     except KeyError as e:
         print(e)
-        exit(1)
+        sys.exit(1)
 
 
 @main.command()
@@ -127,10 +391,11 @@ def remove(name, uuid):
 @click.option(
     '-c', '--comment', 'comment', help='The new comment', default=None)
 def edit(name, uuid, value, time, comment):
-    store = DataStore(os.getcwd())
+    store = open_store()
     goal = load_goal(store, name)
     try:
         if time is not None:
+            from dateparser import parse as dparse
             time = dparse(time)
         if value is not None:
             value = float(value)
@@ -138,7 +403,7 @@ def edit(name, uuid, value, time, comment):
         print('Point with uuid {} edited successfully!'.format(uuid))
     except KeyError as e:
         print(e)
-        exit(1)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+"""Commit files that were already written from a background thread.
+
+A DataStore in background mode writes the goal files right away and puts
+their paths on a CommitQueue. A worker thread commits everything queued
+at once when batch_size changes are waiting or the oldest of them is
+interval seconds old. Queues still open when the interpreter exits are
+flushed then.
+"""
+import atexit
+import threading
+import time
+import weakref
+
+_open_queues = weakref.WeakSet()
+
+
+@atexit.register
+def close_all():
+    """Close every open queue, committing what they hold.
+
+    Registered when this module is imported, so it runs after the
+    handlers registered later, e.g. those of deferred goals, which may
+    still put changes on a queue.
+    """
+    for queue in list(_open_queues):
+        queue.close()
+
+
+class CommitQueue():
+    """Changes waiting to be committed by commit(names, paths, messages).
+
+    Each change names the goals it touches, the paths it wrote and its
+    commit message. A failed commit keeps its changes queued, flush and
+    close retry it and raise its error.
+    """
+
+    def __init__(self, commit, interval=1.0, batch_size=100):
+        self.commit = commit
+        self.interval = interval
+        self.batch_size = batch_size
+        self._condition = threading.Condition()
+        # Serializes commits of the worker and of flush, in queue order.
+        self._committing = threading.Lock()
+        self._names = {}
+        self._paths = {}
+        self._messages = []
+        self._since = None
+        self._error = None
+        self._closed = False
+        self._thread = None
+        _open_queues.add(self)
+
+    def __len__(self):
+        return len(self._messages)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def put(self, names, paths, message):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('The commit queue is closed')
+            self._names.update(dict.fromkeys(names))
+            self._paths.update(dict.fromkeys(paths))
+            self._messages.append(message)
+            if self._since is None:
+                self._since = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='habit-commits', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def flush(self):
+        """Commit all queued changes before returning."""
+        with self._committing:
+            self._commit_batch()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def close(self):
+        """Flush and stop the worker. Later puts raise RuntimeError."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        _open_queues.discard(self)
+        if (self._thread is not None
+                and self._thread is not threading.current_thread()):
+            self._thread.join()
+        self.flush()
+
+    def _due(self):
+        return self._messages and self._error is None and (
+            len(self._messages) >= self.batch_size
+            or time.monotonic() - self._since >= self.interval)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._due():
+                    timeout = None
+                    if self._messages and self._error is None:
+                        timeout = self.interval - (time.monotonic() -
+                                                   self._since)
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+            with self._committing:
+                self._commit_batch()
+
+    def _commit_batch(self):
+        """Commit what is queued, the caller holds self._committing."""
+        with self._condition:
+            if not self._messages:
+                return
+            names, paths, messages = self._names, self._paths, self._messages
+            self._names, self._paths, self._messages = {}, {}, []
+            since, self._since = self._since, None
+        try:
+            self.commit(list(names), list(paths), messages)
+        except Exception as e:
+            with self._condition:
+                names.update(self._names)
+                paths.update(self._paths)
+                self._names, self._paths = names, paths
+                self._messages = messages + self._messages
+                self._since = since
+                self._error = e
+            return
+        with self._condition:
+            self._error = None
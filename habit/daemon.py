@@ -0,0 +1,219 @@
+"""Serve a store to the command line interface over a Unix socket.
+
+Requests and responses are JSON objects, each framed by its length as a
+4 byte big-endian unsigned integer. A request holds the command line
+arguments, a response the output and the exit code of the command.
+"""
+from hashlib import sha1
+from stat import S_ISDIR
+import json
+import os
+import signal
+import socket
+import struct
+import tempfile
+import time
+
+HEADER = struct.Struct('!I')
+FORWARDED_COMMANDS = ('goals', 'list', 'stats', 'add', 'remove', 'edit')
+# Commands that can safely run again if the daemon did not answer.
+READ_COMMANDS = ('goals', 'list', 'stats')
+MAX_SOCKET_PATH = 100
+
+
+def socket_path(store_path):
+    """Path of the socket of the daemon serving the store at store_path.
+
+    It lives in the store's .git directory, or the store directory if
+    there is none, unless that path is too long for a Unix socket, then
+    in a directory only the user can access, see private_directory.
+    """
+    store_path = os.path.abspath(store_path)
+    git_dir = os.path.join(store_path, '.git')
+    if os.path.isdir(git_dir):
+        path = os.path.join(git_dir, 'habit.sock')
+    else:
+        path = os.path.join(store_path, '.habit.sock')
+    if len(path.encode()) <= MAX_SOCKET_PATH:
+        return path
+    digest = sha1(store_path.encode()).hexdigest()[:16]
+    return os.path.join(private_directory(), 'habit-{}.sock'.format(digest))
+
+
+def private_directory():
+    """$XDG_RUNTIME_DIR, or a directory of the user in the temporary one.
+
+    Raises RuntimeError if the latter exists but belongs to someone else
+    or others can access it.
+    """
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime and os.path.isdir(runtime):
+        return runtime
+    path = os.path.join(tempfile.gettempdir(),
+                        'habit-{}'.format(os.getuid()))
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    stat = os.lstat(path)
+    if (not S_ISDIR(stat.st_mode) or stat.st_uid != os.getuid()
+            or stat.st_mode & 0o077):
+        raise RuntimeError('{} is not private to the user'.format(path))
+    return path
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode()
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _receive_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def receive_message(sock):
+    header = _receive_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    data = _receive_exactly(sock, HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode())
+
+
+def forward(store_path, args, timeout=30):
+    """Run args in the daemon serving store_path.
+
+    Returns the response, or None if no daemon of the user is running or
+    it did not answer a command in READ_COMMANDS within timeout seconds.
+    Sockets of other users are not trusted.
+    For other commands that may still run in the daemon RuntimeError is
+    raised instead, running them again could apply them twice.
+    """
+    path = socket_path(store_path)
+    try:
+        if os.stat(path).st_uid != os.getuid():
+            return None
+    except FileNotFoundError:
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(path)
+            send_message(sock, {'args': args})
+        # A refused connection or a missing socket of a daemon that stopped.
+        except OSError:
+            return None
+        try:
+            response = receive_message(sock)
+        except OSError:
+            response = None
+        if response is None and args and args[0] not in READ_COMMANDS:
+            raise RuntimeError(
+                'The daemon serving {} did not answer, {} may have run '
+                'anyway'.format(store_path, args[0]))
+        return response
+
+
+class Daemon():
+    """Answer forwarded commands with goals kept in memory.
+
+    Writes are buffered in a store transaction that is committed once it
+    holds batch_size updates or its oldest update is flush_interval
+    seconds old, and when the daemon stops.
+    """
+
+    def __init__(self, store, run_command, flush_interval=1.0,
+                 batch_size=100):
+        self.store = store
+        self.run_command = run_command
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.path = socket_path(store.path)
+        self._running = False
+        self._pending_since = None
+
+    def _bind(self):
+        if os.path.exists(self.path):
+            if forward(self.store.path, None, timeout=1) is not None:
+                raise RuntimeError(
+                    'A daemon is already serving {}'.format(self.store.path))
+            os.remove(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        sock.listen(16)
+        return sock
+
+    def stop(self, *args):
+        self._running = False
+
+    def serve_forever(self):
+        sock = self._bind()
+        self._running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        self.store.begin()
+        try:
+            while self._running:
+                sock.settimeout(min(self.flush_interval, 0.5))
+                try:
+                    connection, _ = sock.accept()
+                except socket.timeout:
+                    connection = None
+                except InterruptedError:  # pragma: no cover
+                    continue
+                if connection is not None:
+                    with connection:
+                        self._handle(connection)
+                self._flush_if_due()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sock.close()
+            os.remove(self.path)
+            self.store.commit()
+
+    def _handle(self, connection):
+        connection.settimeout(5)
+        try:
+            request = receive_message(connection)
+        except (OSError, ValueError):
+            return
+        if request is None:
+            return
+        args = request.get('args')
+        if not args:
+            self._reply(connection, {'output': '', 'exit_code': 0})
+            return
+        if args[0] not in FORWARDED_COMMANDS:
+            self._reply(connection, {
+                'output': 'Command {} is not served\n'.format(args[0]),
+                'exit_code': 2
+            })
+            return
+        output, exit_code = self.run_command(args, self.store)
+        if self.store.pending and self._pending_since is None:
+            self._pending_since = time.monotonic()
+        self._reply(connection, {'output': output, 'exit_code': exit_code})
+
+    def _reply(self, connection, response):
+        # The client may have given up waiting and gone away.
+        try:
+            send_message(connection, response)
+        except OSError:
+            pass
+
+    def _flush_if_due(self):
+        if not self.store.pending:
+            return
+        if (self.store.pending >= self.batch_size or time.monotonic() -
+                self._pending_since >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        self.store.commit()
+        self.store.begin()
+        self._pending_since = None
@@ -0,0 +1,219 @@
+"""Commit files straight into the object database of a git repository.
+
+IndexFile.add and IndexFile.commit hash the files, parse and rewrite the
+whole index and build every tree from it. commit_files instead writes the
+blobs of the changed files, rewrites only the trees on their paths and
+creates the commit on top of HEAD. Afterwards the index entries of the
+files are patched in place from the known blob ids and stats, falling
+back to GitPython for index layouts that cannot be patched.
+"""
+from hashlib import sha1
+from io import BytesIO
+import os
+import stat
+import struct
+
+TREE_MODE = 0o040000
+FILE_MODE = 0o100644
+EXECUTABLE_MODE = 0o100755
+
+INDEX_HEADER = struct.Struct('>4sLL')
+# ctime, mtime, dev, inode, mode, uid, gid, size, sha and flags.
+INDEX_ENTRY = struct.Struct('>LLLLLLLLLL20sH')
+EXTENDED_FLAG = 0x4000
+STAGE_MASK = 0x3000
+# Extensions that summarize the entries and get stale when one changes.
+# git rebuilds them when it needs them.
+STALE_EXTENSIONS = (b'TREE', b'EOIE', b'IEOT')
+# Extensions that move entries out of the index file.
+UNSUPPORTED_EXTENSIONS = (b'link', b'sdir')
+
+
+def write_object(odb, kind, data):
+    from gitdb import IStream
+    return odb.store(IStream(kind, len(data), BytesIO(data))).binsha
+
+
+def parse_tree(data):
+    """The entries of a tree object as a dict of name to (mode, binsha)."""
+    entries = {}
+    i = 0
+    while i < len(data):
+        space = data.index(b' ', i)
+        nul = data.index(b'\0', space)
+        entries[data[space + 1:nul].decode()] = (int(data[i:space], 8),
+                                                 data[nul + 1:nul + 21])
+        i = nul + 21
+    return entries
+
+
+def _tree_order(item):
+    name, (mode, _) = item
+    return (name + '/' if mode == TREE_MODE else name).encode()
+
+
+def serialize_tree(entries):
+    return b''.join(
+        b'%o %s\0%s' % (mode, name.encode(), sha)
+        for name, (mode, sha) in sorted(entries.items(), key=_tree_order))
+
+
+def update_tree(odb, binsha, changes):
+    """Write the tree binsha with changes applied, return its id.
+
+    changes maps tuples of path components to the new (mode, binsha) of
+    the file, or None to remove it. Subtrees without changes are kept as
+    they are. Returns None for an empty tree.
+    """
+    entries = {} if binsha is None else parse_tree(odb.stream(binsha).read())
+    subtrees = {}
+    for parts, entry in changes.items():
+        if len(parts) > 1:
+            subtrees.setdefault(parts[0], {})[parts[1:]] = entry
+        elif entry is None:
+            entries.pop(parts[0], None)
+        else:
+            entries[parts[0]] = entry
+    for name, subchanges in subtrees.items():
+        mode, sha = entries.get(name, (None, None))
+        sha = update_tree(odb, sha if mode == TREE_MODE else None,
+                          subchanges)
+        if sha is None:
+            entries.pop(name, None)
+        else:
+            entries[name] = (TREE_MODE, sha)
+    if not entries:
+        return None
+    return write_object(odb, b'tree', serialize_tree(entries))
+
+
+def file_mode(st):
+    if st.st_mode & stat.S_IXUSR:
+        return EXECUTABLE_MODE
+    return FILE_MODE
+
+
+def index_fields(mode, binsha, st):
+    """The fields of an index entry up to its flags, as git packs them."""
+    mask = 0xffffffff
+    return (int(st.st_ctime) & mask, st.st_ctime_ns % 1000000000,
+            int(st.st_mtime) & mask, st.st_mtime_ns % 1000000000,
+            st.st_dev & mask, st.st_ino & mask, mode, st.st_uid & mask,
+            st.st_gid & mask, st.st_size & mask, binsha)
+
+
+def commit_files(repo, paths, message):
+    """Commit the current content of paths on top of HEAD.
+
+    Paths that do not exist are removed from the commit. Returns the new
+    commit, or HEAD if the content of the paths is committed already.
+    """
+    from git.objects import Commit, Tree
+    odb = repo.odb
+    changes = {}
+    entries = {}
+    for path in paths:
+        relative = os.path.relpath(path, repo.working_tree_dir).replace(
+            os.sep, '/')
+        try:
+            st = os.stat(path)
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            changes[tuple(relative.split('/'))] = entries[relative] = None
+            continue
+        mode = file_mode(st)
+        binsha = write_object(odb, b'blob', data)
+        changes[tuple(relative.split('/'))] = (mode, binsha)
+        entries[relative] = index_fields(mode, binsha, st)
+    head = repo.head.commit if repo.head.is_valid() else None
+    tree = update_tree(odb, head.tree.binsha if head else None, changes)
+    if tree is None:
+        tree = write_object(odb, b'tree', b'')
+    if head is not None and tree == head.tree.binsha:
+        commit = head
+    else:
+        commit = Commit.create_from_tree(
+            repo,
+            Tree(repo, tree, mode=TREE_MODE, path=''),
+            message,
+            parent_commits=[head] if head else [],
+            head=True)
+    if not patch_index(os.path.join(repo.git_dir, 'index'), entries):
+        update_index(repo, entries)
+    return commit
+
+
+def patch_index(path, entries):
+    """Overwrite the index entries of paths that are already in the index.
+
+    entries maps paths to the fields of their entry. Returns False without
+    writing anything if an entry would have to be added or removed, or if
+    the index uses a layout this does not handle.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = bytearray(f.read())
+    except FileNotFoundError:
+        return False
+    signature, version, count = INDEX_HEADER.unpack_from(data)
+    if (signature != b'DIRC' or version not in (2, 3)
+            or None in entries.values()):
+        return False
+    remaining = dict(entries)
+    offset = INDEX_HEADER.size
+    for _ in range(count):
+        flags = INDEX_ENTRY.unpack_from(data, offset)[-1]
+        start = offset + INDEX_ENTRY.size
+        if flags & EXTENDED_FLAG:
+            start += 2
+        end = data.index(b'\0', start)
+        name = data[start:end].decode()
+        if name in remaining and not flags & STAGE_MASK:
+            INDEX_ENTRY.pack_into(data, offset, *remaining.pop(name), flags)
+        offset += (end - offset + 8) & ~7
+    if remaining:
+        return False
+    content = [bytes(data[:offset])]
+    while offset < len(data) - 20:
+        signature, size = struct.unpack_from('>4sL', data, offset)
+        if signature in UNSUPPORTED_EXTENSIONS:
+            return False
+        if signature not in STALE_EXTENSIONS:
+            content.append(bytes(data[offset:offset + 8 + size]))
+        offset += 8 + size
+    content = b''.join(content)
+    _write_locked(path, content + sha1(content).digest())
+    return True
+
+
+def _write_locked(path, content):
+    """Replace the file at path the way git does, through path.lock."""
+    lock = path + '.lock'
+    fd = os.open(lock, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(lock, path)
+    except BaseException:
+        if os.path.exists(lock):
+            os.remove(lock)
+        raise
+
+
+def update_index(repo, entries):
+    """Set the index entries of paths with GitPython, None removes one."""
+    from git.index import IndexFile
+    from git.index.typ import IndexEntry
+    index = IndexFile(repo)
+    for path, fields in entries.items():
+        if fields is None:
+            index.entries.pop((path, 0), None)
+            continue
+        (ctime, ctime_ns, mtime, mtime_ns, dev, inode, mode, uid, gid, size,
+         binsha) = fields
+        index.entries[(path, 0)] = IndexEntry(
+            (mode, binsha, 0, path, struct.pack('>LL', ctime, ctime_ns),
+             struct.pack('>LL', mtime, mtime_ns), dev, inode, uid, gid,
+             size))
+    index.write(ignore_extension_data=True)
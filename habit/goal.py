@@ -1,16 +1,163 @@
 from collections import namedtuple
+from contextlib import contextmanager
 import datetime as dt
-from dateutil.relativedelta import relativedelta
-import yaml
+import os
 from uuid import uuid4
+from habit.points import ColumnarPoints, SortedPoints, EPOCH
+from habit.schedule import Schedule, chop_microseconds  # noqa: F401
 
 
-def chop_microseconds(delta):
-    return delta - dt.timedelta(microseconds=delta.microseconds)
+class Row(list):
+    """A list that is written as a single flow style line."""
 
 
+def represent_row(dumper, row):
+    return dumper.represent_sequence(
+        'tag:yaml.org,2002:seq', row, flow_style=True)
+
+
+_yaml = None
+
+
+def yaml_classes():
+    """The yaml module with the loader and dumper used for goal files.
+
+    PyYAML is imported on first use, with the libyaml based classes when
+    they are available.
+    """
+    global _yaml
+    if _yaml is None:
+        import yaml
+        try:
+            from yaml import CSafeLoader as Loader, CSafeDumper as Dumper
+        except ImportError:  # pragma: no cover
+            from yaml import SafeLoader as Loader, SafeDumper as Dumper
+
+        class GoalDumper(Dumper):
+            pass
+
+        GoalDumper.add_representer(Row, represent_row)
+        _yaml = (yaml, Loader, GoalDumper)
+    return _yaml
+
+
+MAX_LISTED_MATCHES = 10
+
 Point = namedtuple('Point', ['stamp', 'value', 'comment', 'uuid'])
 
+ONE_SECOND = dt.timedelta(seconds=1)
+
+
+def stamp_to_epoch(stamp):
+    """Seconds since the epoch, an int unless stamp has microseconds."""
+    if stamp.microsecond:
+        return (stamp - EPOCH) / ONE_SECOND
+    return (stamp - EPOCH) // ONE_SECOND
+
+
+def epoch_to_stamp(seconds):
+    return EPOCH + dt.timedelta(seconds=seconds)
+
+
+def point_to_row(point):
+    return Row((stamp_to_epoch(point.stamp), point.value, point.comment,
+                point.uuid))
+
+
+def row_to_point(row):
+    stamp, value, comment, uuid = row
+    return Point(stamp=epoch_to_stamp(stamp), value=value, comment=comment,
+                 uuid=uuid)
+
+
+def point_to_dict(point):
+    return {
+        'stamp': point.stamp,
+        'value': point.value,
+        'comment': point.comment,
+        'uuid': point.uuid
+    }
+
+
+def dict_to_point(data):
+    return Point(**data)
+
+
+META_FILENAME = 'meta.yaml'
+
+
+def month_of(stamp):
+    return stamp.year, stamp.month
+
+
+def month_bounds(month):
+    """First and last microsecond of a (year, month) pair."""
+    year, month = month
+    start = dt.datetime(year, month, 1)
+    if month == 12:
+        end = dt.datetime(year + 1, 1, 1)
+    else:
+        end = dt.datetime(year, month + 1, 1)
+    return start, end - dt.timedelta(microseconds=1)
+
+
+def shard_filename(month):
+    return '{:04d}-{:02d}.yaml'.format(*month)
+
+
+def shard_month(filename):
+    """The (year, month) of a shard file name, None for other files."""
+    name, extension = os.path.splitext(filename)
+    try:
+        year, month = name.split('-')
+        month = int(year), int(month)
+    except ValueError:
+        return None
+    if extension != '.yaml' or not 1 <= month[1] <= 12:
+        return None
+    return month
+
+
+def list_shards(directory):
+    """Months and paths of the shards in directory, ordered by month."""
+    shards = []
+    for filename in os.listdir(directory):
+        month = shard_month(filename)
+        if month is not None:
+            shards.append((month, os.path.join(directory, filename)))
+    return sorted(shards)
+
+
+def dump_yaml(data, path):
+    """Write data to path, replacing the file at once for readers."""
+    yaml, _, dumper = yaml_classes()
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(temporary, 'w') as f:
+            yaml.dump(data, f, Dumper=dumper, default_flow_style=False)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def load_yaml(path):
+    yaml, loader, _ = yaml_classes()
+    with open(path) as f:
+        return yaml.load(f, Loader=loader)
+
+
+def points_to_data(points, compact):
+    if compact:
+        return [point_to_row(p) for p in points]
+    return [point_to_dict(p) for p in points]
+
+
+def data_to_points(datapoints):
+    if datapoints and isinstance(datapoints[0], list):
+        return (row_to_point(row) for row in datapoints)
+    return (dict_to_point(p) for p in datapoints)
+
 
 def create_point(value, stamp=None, comment=''):
     if stamp is None:
@@ -26,78 +173,297 @@ def add_point_to_sorted_tuple(t, p):
 
 
 class Goal():
+    """A commitment to follow the schedule of its reference points.
+
+    Every change of its content bumps the version, which caches and
+    indexes can use to notice changes. The hash of the content is cached
+    until the version changes.
+
+    Methods that change a goal attached to a store write it afterwards,
+    unless they did not change anything. In deferred mode the changes
+    are kept until flush is called or the process exits and then written
+    with a single commit.
+    """
+
     def __init__(self,
                  name,
                  pledge,
                  reference_points,
                  active=True,
-                 datapoints=()):
+                 datapoints=(),
+                 columnar=False):
+        self._points_type = ColumnarPoints if columnar else SortedPoints
+        self._version = 0
+        self._hash = None
         self.name = name
         self.pledge = pledge
         self.active = active
         self.reference_points = reference_points
         self.datapoints = datapoints
+        # Set when anything but the datapoints changes, as those changes
+        # are not recorded, and cleared by the store once it wrote them.
+        self.meta_dirty = False
         self.store = None
+        # Set by the store to what it read the goal from, see DataStore.
+        self.base = None
+        self._changes = []
+        self._messages = []
+        self._deferred = False
+        self._saved_version = self._version
+
+    @property
+    def version(self):
+        """Number of changes made to the goal since it was created."""
+        return self._version
+
+    def _bump(self):
+        self._version += 1
+        self._hash = None
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+        self.meta_dirty = True
+        self._bump()
+
+    @property
+    def pledge(self):
+        return self._pledge
+
+    @pledge.setter
+    def pledge(self, pledge):
+        self._pledge = pledge
+        self.meta_dirty = True
+        self._bump()
+
+    @property
+    def active(self):
+        return self._active
+
+    @active.setter
+    def active(self, active):
+        self._active = active
+        self.meta_dirty = True
+        self._bump()
+
+    @property
+    def reference_points(self):
+        return self._reference_points
+
+    @reference_points.setter
+    def reference_points(self, reference_points):
+        self._reference_points = reference_points
+        self._schedule = None
+        self.meta_dirty = True
+        self._bump()
+
+    @property
+    def schedule(self):
+        if self._schedule is None:
+            self._schedule = Schedule(self._reference_points)
+        return self._schedule
+
+    @property
+    def datapoints(self):
+        return self._datapoints
+
+    @datapoints.setter
+    def datapoints(self, datapoints):
+        self._datapoints = self._points_type(datapoints)
+        self._bump()
+
+    @property
+    def columnar(self):
+        return self._points_type is ColumnarPoints
+
+    @property
+    def dirty(self):
+        """Whether the goal changed since it was created or last written."""
+        return self._version != self._saved_version
 
     def _update(commit_msg):
         def wrapper(func):
             def wrapped_f(s, *args, **kwargs):
+                store, version = s.store, s._version
                 func(s, *args, **kwargs)
-                if s.store:
-                    s.store.update_goal(
-                        s, 'Goal {}: {}'.format(s.name, commit_msg))
+                if not s.store:
+                    s._changes = []
+                    return
+                if s.store is store and s._version == version:
+                    return
+                s._messages.append('Goal {}: {}'.format(s.name, commit_msg))
+                if not s._deferred or s.store is not store:
+                    s.flush()
 
             return wrapped_f
 
         return wrapper
 
+    def defer(self, enabled=True):
+        """Switch deferred mode on or, after flushing, off."""
+        import atexit
+        if enabled and not self._deferred:
+            atexit.register(self.flush)
+        elif not enabled and self._deferred:
+            atexit.unregister(self.flush)
+            self.flush()
+        self._deferred = enabled
+
+    def flush(self):
+        """Write the changes made so far with a single commit."""
+        if not self.store or not (self._messages or self.dirty):
+            return
+        messages, self._messages = self._messages, []
+        changes, self._changes = self._changes, []
+        if not messages:
+            message = 'Goal {}: Updated.'.format(self.name)
+        elif len(messages) == 1:
+            message = messages[0]
+        else:
+            message = 'Goal {}: {} changes\n\n{}'.format(
+                self.name, len(messages), '\n'.join(messages))
+        self.store.update_goal(self, message, changes)
+        self._saved_version = self._version
+
     @_update("Added.")
     def set_store(self, store):
-        if self.name in store.list_goal_names():
+        if store.has_goal(self.name):
             raise ValueError(
                 'A goal with name {} already exists in the store'.format(
                     self.name))
         self.store = store
 
-    def value(self):
-        return sum(p.value for p in self.datapoints)
+    def copy(self):
+        """A copy of the goal that is not attached to a store."""
+        return Goal(
+            name=self.name,
+            pledge=self.pledge,
+            reference_points=self.reference_points,
+            active=self.active,
+            datapoints=self.datapoints,
+            columnar=self.columnar)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['store'] = None
+        state['_changes'] = []
+        state['_messages'] = []
+        state['_deferred'] = False
+        return state
+
+    @contextmanager
+    def batch(self):
+        """Write all changes made in the block with a single commit."""
+        if self.store is None:
+            yield self
+            return
+        with self.store.transaction():
+            yield self
+
+    def value(self, at=None):
+        if at is None:
+            return self._datapoints.total
+        return self._datapoints.total_until(at)
 
     def __eq__(self, other):
-        return self.__hash__() == hash(other)
+        if self is other:
+            return True
+        if not isinstance(other, Goal):
+            return self.__hash__() == hash(other)
+        if (self._name != other._name or self._pledge != other._pledge
+                or self._active != other._active
+                or len(self._datapoints) != len(other._datapoints)
+                or self._reference_points != other._reference_points):
+            return False
+        return self.__hash__() == other.__hash__()
 
     def __hash__(self):
-        return hash((self.name, self.pledge, self.active,
-                     self.reference_points, self.datapoints))
+        if self._hash is not None:
+            return self._hash
+        content_hash = hash((self.name, self.pledge, self.active,
+                             self.reference_points, self.datapoints))
+        # Points kept outside the goal may change behind its back.
+        if isinstance(self._datapoints, SortedPoints):
+            self._hash = content_hash
+        return content_hash
+
+    def apply_change(self, change):
+        """Apply a recorded (operation, point) change to the datapoints.
+
+        The operation is one of 'add', 'remove' and 'edit'; removed and
+        edited points are looked up by the full uuid of point.
+        """
+        operation, point = change
+        self._bump()
+        if operation == 'add':
+            self._datapoints.insert(point)
+            return
+        matches, count = self._datapoints.find(point.uuid, limit=1)
+        if count != 1:
+            raise KeyError('No match for uuid {} found'.format(point.uuid))
+        if operation == 'remove':
+            self._datapoints.remove(matches[0])
+        elif operation == 'edit':
+            self._datapoints.replace(matches[0], point)
+        else:
+            raise ValueError('Unknown operation {}'.format(operation))
+
+    def _change(self, operation, point):
+        self.apply_change((operation, point))
+        self._changes.append((operation, point))
 
     @_update("Added datapoint")
     def add_point(self, point):
-        self.datapoints = add_point_to_sorted_tuple(self.datapoints, point)
+        self._change('add', point)
+
+    @_update("Imported datapoints")
+    def add_points(self, points):
+        points = list(points)
+        if not points:
+            return
+        self._datapoints.merge(points)
+        self._bump()
+        self._changes.extend(('add', point) for point in points)
 
     @_update("Removed datapoint")
     def remove_point(self, uuid):
 
         point = self.find_datapoint(uuid)
-        self.datapoints = tuple(d for d in self.datapoints if d != point)
+        self._change('remove', point)
 
     @_update("Edited datapoint")
     def edit_point(self, uuid, value=None, stamp=None, comment=None):
-        point = self.find_datapoint(uuid)
-        self.datapoints = tuple(d for d in self.datapoints if d != point)
+        old = point = self.find_datapoint(uuid)
         if value is not None:
-            point = point._replace(value=value)
+            point = point._replace(value=float(value))
         if stamp is not None:
             point = point._replace(stamp=stamp)
         if comment is not None:
             point = point._replace(comment=comment)
-        self.datapoints = add_point_to_sorted_tuple(self.datapoints, point)
+        if point == old:
+            return
+        if point.stamp != old.stamp:
+            # Recorded as a move, so the old stamp is among the changes.
+            self._change('remove', old)
+            self._change('add', point)
+        else:
+            self._change('edit', point)
 
     def find_datapoint(self, uuid):
-        candidates = [d for d in self.datapoints if d.uuid.startswith(uuid)]
-        if not candidates:
+        candidates, count = self._datapoints.find(
+            uuid, limit=MAX_LISTED_MATCHES)
+        if not count:
             raise KeyError('No match for uuid {} found'.format(uuid))
-        if len(candidates) > 1:
-            raise KeyError('There are multiple matches for uuid {}, '.format(
-                uuid) + ','.join((p.uuid for p in candidates)))
+        if count > 1:
+            message = 'There are multiple matches for uuid {}, '.format(
+                uuid) + ','.join((p.uuid for p in candidates))
+            if count > len(candidates):
+                message += ' and {} more'.format(count - len(candidates))
+            raise KeyError(message)
         return candidates[0]
 
     def add_reference_point(self, point):
@@ -105,45 +471,105 @@ class Goal():
             self.reference_points, point)
 
     def time_remaining(self, now):
-        for start_point, end_point in zip(self.reference_points[:-1],
-                                          self.reference_points[1:]):
-            if end_point.stamp < now:
-                continue
-            dy = end_point.value - start_point.value
-            dx = end_point.stamp - start_point.stamp
-
-            delta = (((self.value() - start_point.value) / dy) * dx) - (
-                now - start_point.stamp)
-            return chop_microseconds(delta)
-
-    def toYAML(self, path):
-        with open(path, 'w') as f:
-            yaml.dump({
-                'name':
-                self.name,
-                'pledge':
-                self.pledge,
-                'active':
-                self.active,
-                'reference_points':
-                [dict(p._asdict()) for p in self.reference_points],
-                'datapoints': [dict(p._asdict()) for p in self.datapoints],
-            }, f)
-
-    def fromYAML(path):
-        with open(path) as f:
-            data = yaml.safe_load(f)
-        goal = Goal(
+        return self.schedule.time_remaining(self.value(), now)
+
+    def rollup(self, by='day'):
+        """Sum, count, mean and cumulative value of the datapoints per day,
+        week or month, next to the reference line, see habit.rollup."""
+        from habit.rollup import rollup
+        return rollup(self._datapoints, by, self.schedule)
+
+    def time_remaining_series(self, nows):
+        """Time remaining at each of nows, given the value at that time."""
+        values = [self.value(at=now) for now in nows]
+        return self.schedule.time_remaining_many(values, nows)
+
+    def toYAML(self, path, compact=False):
+        """Write the goal to path.
+
+        The compact layout stores each datapoint as a flow style row of
+        epoch seconds, value, comment and uuid instead of a mapping.
+        """
+        data = self._meta()
+        data['datapoints'] = points_to_data(self.datapoints, compact)
+        dump_yaml(data, path)
+
+    def _meta(self):
+        return {
+            'name': self.name,
+            'pledge': self.pledge,
+            'active': self.active,
+            'reference_points':
+            [point_to_dict(p) for p in self.reference_points],
+        }
+
+    def fromYAML(path, columnar=False):
+        data = load_yaml(path)
+        return Goal._from_data(data,
+                               data_to_points(data.get('datapoints') or ()),
+                               columnar)
+
+    def _from_data(data, datapoints, columnar):
+        return Goal(
             name=data.get('name'),
             pledge=data.get('pledge'),
             active=data.get('active'),
             reference_points=tuple(
-                [Point(**p) for p in data.get('reference_points')]),
-            datapoints=tuple([Point(**p) for p in data.get('datapoints')]))
-        return goal
+                [dict_to_point(p) for p in data.get('reference_points')]),
+            datapoints=datapoints,
+            columnar=columnar)
+
+    def toShards(self, directory, months=None, compact=False):
+        """Write the goal into directory, split into monthly shards.
+
+        meta.yaml holds everything but the datapoints, which go into one
+        file per month named like 2019-06.yaml. With months, a collection
+        of (year, month) pairs, only the shards of those months are
+        rewritten. Shards without points are removed. Returns the paths
+        of the files written or removed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        meta = os.path.join(directory, META_FILENAME)
+        dump_yaml(self._meta(), meta)
+        paths = [meta]
+        existing = dict(list_shards(directory))
+        if months is None:
+            months = set(existing)
+            months.update(month_of(p.stamp) for p in self.datapoints)
+        for month in sorted(set(months)):
+            path = os.path.join(directory, shard_filename(month))
+            points = list(self.datapoints.between(*month_bounds(month)))
+            if points:
+                dump_yaml({'datapoints': points_to_data(points, compact)},
+                          path)
+            elif month in existing:
+                os.remove(path)
+            else:
+                continue
+            paths.append(path)
+        return paths
+
+    def fromShards(directory, since=None, until=None, columnar=False):
+        """Read a goal written by toShards.
+
+        With since or until only the shards of the months overlapping
+        that range are read.
+        """
+        data = load_yaml(os.path.join(directory, META_FILENAME))
+        first = None if since is None else month_of(since)
+        last = None if until is None else month_of(until)
+        datapoints = []
+        for month, path in list_shards(directory):
+            if ((first is None or month >= first)
+                    and (last is None or month <= last)):
+                shard = load_yaml(path) or {}
+                datapoints.extend(
+                    data_to_points(shard.get('datapoints') or ()))
+        return Goal._from_data(data, datapoints, columnar)
 
 
 def create_goal(name, daily_slope, pledge, initial_pause_days=3):
+    from dateutil.relativedelta import relativedelta
     now = dt.datetime.now()
     p1 = create_point(stamp=now, value=-initial_pause_days * daily_slope)
     end = now + relativedelta(years=10)
@@ -0,0 +1,115 @@
+"""Past versions of goals, read straight from the git object database.
+
+Every change to a DataStore is committed, so the history of the
+repository holds every version of each goal. GoalHistory rebuilds a goal
+as of any commit from the blobs of its files without touching the working
+tree. Trees and parsed blobs are cached by their id, so walking many
+commits parses each version of a file only once.
+"""
+import datetime as dt
+
+from habit.cache import BlobCache
+from habit.gitobjects import TREE_MODE, parse_tree
+from habit.goal import (META_FILENAME, Goal, data_to_points, shard_month,
+                        yaml_classes)
+from habit.journal import parse_changes
+
+
+def resolve_commit(repo, at):
+    """The commit named by at, or the last one made before at if it is a
+    datetime. Raises ValueError if there is no such commit."""
+    if isinstance(at, dt.datetime):
+        sha = ''
+        if repo.head.is_valid():
+            sha = repo.git.rev_list(
+                '-1', '--before={}'.format(at.astimezone().isoformat()),
+                'HEAD')
+        if not sha:
+            raise ValueError('There is no commit before {}'.format(at))
+        return repo.commit(sha)
+    from gitdb.exc import ODBError
+    try:
+        return repo.commit(at)
+    except (ODBError, ValueError):
+        raise ValueError('{} does not name a commit'.format(at))
+
+
+def goal_paths(name):
+    """The paths in the repository a goal can be written to."""
+    return ['{}.yaml'.format(name), '{}.journal'.format(name), name]
+
+
+class GoalHistory():
+    """Goals of a repository as of any of its commits."""
+
+    def __init__(self, repo, capacity=1024):
+        self.repo = repo
+        self.objects = BlobCache(capacity)
+
+    def goal_at(self, name, at):
+        """The goal named name as of at, see resolve_commit.
+
+        Raises KeyError if the goal did not exist at that commit.
+        """
+        commit = resolve_commit(self.repo, at)
+        goal = self._goal(commit.tree.binsha, name)
+        if goal is None:
+            raise KeyError('There was no goal named {} at commit {}'.format(
+                name, commit.hexsha[:8]))
+        return goal
+
+    def versions(self, name, rev='HEAD', reverse=False):
+        """Yield (commit, goal) for each commit that changed the goal.
+
+        The commits come newest first, or oldest first with reverse. goal
+        is None for a commit that removed the goal.
+        """
+        if not self.repo.head.is_valid():
+            return
+        for commit in self.repo.iter_commits(
+                rev, paths=goal_paths(name), reverse=reverse):
+            yield commit, self._goal(commit.tree.binsha, name)
+
+    def _read(self, binsha):
+        return self.repo.odb.stream(binsha).read()
+
+    def _tree(self, binsha):
+        return parse_tree(self._read(binsha))
+
+    def _document(self, binsha):
+        """A YAML file as its data without the datapoints and the points."""
+        yaml, loader, _ = yaml_classes()
+        data = yaml.load(self._read(binsha), Loader=loader) or {}
+        return data, tuple(data_to_points(data.pop('datapoints', None) or ()))
+
+    def _changes(self, binsha):
+        return tuple(
+            parse_changes(self._read(binsha).decode().splitlines(True)))
+
+    def _goal(self, tree, name):
+        """The goal named name in the tree of the store, or None."""
+        entries = self.objects.get(tree, self._tree)
+        mode, sha = entries.get(name, (None, None))
+        if mode == TREE_MODE:
+            return self._sharded_goal(sha)
+        mode, sha = entries.get('{}.yaml'.format(name), (None, None))
+        if sha is None:
+            return None
+        goal = Goal._from_data(*self.objects.get(sha, self._document),
+                               False)
+        _, sha = entries.get('{}.journal'.format(name), (None, None))
+        if sha is not None:
+            for change in self.objects.get(sha, self._changes):
+                goal.apply_change(change)
+        return goal
+
+    def _sharded_goal(self, tree):
+        entries = self.objects.get(tree, self._tree)
+        if META_FILENAME not in entries:
+            return None
+        datapoints = []
+        for filename, (_, sha) in sorted(entries.items()):
+            if shard_month(filename) is not None:
+                datapoints.extend(self.objects.get(sha, self._document)[1])
+        data, _ = self.objects.get(entries[META_FILENAME][1], self._document)
+        return Goal._from_data(data, datapoints, False)
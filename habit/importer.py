@@ -0,0 +1,62 @@
+import csv
+import datetime as dt
+import json
+import os
+import re
+from habit.goal import create_point
+
+FORMATS = ('csv', 'jsonl')
+EPOCH_STAMP = re.compile(r'^[+-]?\d+(\.\d*)?$')
+
+
+def guess_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.json', '.ndjson'):
+        return 'jsonl'
+    raise ValueError(
+        'Cannot guess the format of {}, use one of {}'.format(
+            path, ', '.join(FORMATS)))
+
+
+def parse_stamp(stamp):
+    """Parse epoch seconds or an ISO 8601 string into a naive local time.
+
+    Strings are read as ISO 8601 first, so that basic dates like 20190618
+    are not taken for seconds, and as epoch seconds only if they are not
+    ISO 8601 but a plain number.
+    """
+    if isinstance(stamp, (int, float)):
+        return dt.datetime.fromtimestamp(stamp)
+    from dateutil.parser import isoparse
+    try:
+        stamp = isoparse(stamp)
+    except ValueError:
+        if not EPOCH_STAMP.match(stamp):
+            raise
+        return dt.datetime.fromtimestamp(float(stamp))
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone().replace(tzinfo=None)
+    return stamp
+
+
+def read_records(f, fmt):
+    if fmt == 'csv':
+        return csv.DictReader(f)
+    if fmt == 'jsonl':
+        return (json.loads(line) for line in f if line.strip())
+    raise ValueError('Unknown format {}, use one of {}'.format(
+        fmt, ', '.join(FORMATS)))
+
+
+def read_points(f, fmt):
+    """Stream points from records with stamp, value and optional comment."""
+    for number, record in enumerate(read_records(f, fmt), 1):
+        try:
+            yield create_point(
+                value=float(record['value']),
+                stamp=parse_stamp(record['stamp']),
+                comment=record.get('comment') or '')
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError('Invalid record {}: {}'.format(number, e))
@@ -0,0 +1,50 @@
+import json
+import os
+from habit.goal import point_to_row, row_to_point
+
+
+def parse_changes(lines):
+    """Yield the changes of the journal lines as (operation, point)."""
+    for line in lines:
+        # Skips a line another process is still appending.
+        if not line.strip() or not line.endswith('\n'):
+            continue
+        row = json.loads(line)
+        yield row[0], row_to_point(row[1:])
+
+
+class Journal():
+    """Append-only log of datapoint changes next to a goal snapshot.
+
+    Each line is a JSON array of the operation followed by the point as a
+    row of epoch seconds, value, comment and uuid.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def append(self, changes):
+        with open(self.path, 'a') as f:
+            for operation, point in changes:
+                f.write(json.dumps([operation] + point_to_row(point)))
+                f.write('\n')
+
+    def changes(self):
+        try:
+            with open(self.path) as f:
+                yield from parse_changes(f)
+        except FileNotFoundError:
+            return
+
+    def replay(self, goal):
+        for change in self.changes():
+            goal.apply_change(change)
+
+    def clear(self):
+        open(self.path, 'w').close()
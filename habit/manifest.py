@@ -0,0 +1,171 @@
+from collections import namedtuple
+from contextlib import contextmanager
+import json
+import os
+import tempfile
+from habit.cache import file_sha, file_stat
+from habit.goal import point_to_row, row_to_point
+from habit.schedule import Schedule
+
+
+class GoalSummary(
+        namedtuple('GoalSummary',
+                   ['name', 'pledge', 'active', 'value', 'reference_points'])):
+    """What the manifest knows about a goal without reading its file."""
+
+    @classmethod
+    def of(cls, goal):
+        return cls(
+            name=goal.name,
+            pledge=goal.pledge,
+            active=goal.active,
+            value=goal.value(),
+            reference_points=goal.reference_points)
+
+    def time_remaining(self, now):
+        return Schedule(self.reference_points).time_remaining(self.value, now)
+
+
+class Manifest():
+    """Persisted list of the goals in a store with a summary of each.
+
+    The names are rescanned only when the modification time of the store
+    directory changed, i.e. when files were created, removed or renamed.
+    The store writes its own files in a writing block, so those writes do
+    not count. A summary is refreshed when the files of its goal changed.
+
+    lock returns a context manager that holds a lock shared by all
+    processes using the store, writing blocks hold it throughout.
+    """
+
+    def __init__(self, path, directory, scan, goal_files, lock):
+        self.path = path
+        self.directory = directory
+        self._scan = scan
+        self._goal_files = goal_files
+        self._lock = lock
+        self._data = None
+        # Stat of the file when this process last read or wrote it.
+        self._stat = None
+        self._locked = False
+        self._writing = False
+
+    def _load(self):
+        if self._data is None:
+            self._stat = file_stat(self.path)
+            try:
+                with open(self.path) as f:
+                    self._data = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._data = {'directory': None, 'goals': {}}
+        goals = self._data['goals']
+        directory = list(file_stat(self.directory))
+        if not self._writing and self._data['directory'] != directory:
+            names = self._scan()
+            self._data['directory'] = directory
+            # Replacing a goal file changes the directory but not the names.
+            if list(goals) != names:
+                goals = {name: goals.get(name) for name in names}
+                self._data['goals'] = goals
+                self._save()
+        return goals
+
+    def _save(self):
+        """Write the data, unless another process wrote the file since
+        this one read it. Then the data is dropped and read again on the
+        next use, it is only a cache."""
+        if self._locked:
+            self._write()
+            return
+        with self._lock():
+            if file_stat(self.path) != self._stat:
+                self._data = None
+                return
+            self._write()
+
+    def _write(self):
+        fd, path = tempfile.mkstemp(
+            dir=os.path.dirname(self.path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            # dumps uses the C encoder, which dump does not.
+            f.write(json.dumps(self._data))
+        os.replace(path, self.path)
+        self._stat = file_stat(self.path)
+
+    def _files_stat(self, name):
+        return [list(file_stat(path) or ()) for path in self._goal_files(name)]
+
+    def names(self):
+        return list(self._load())
+
+    def __contains__(self, name):
+        return name in self._load()
+
+    @contextmanager
+    def writing(self):
+        """Take the directory as it is after the block as scanned.
+
+        The block holds the lock, so only this store writes goal files in
+        it and adds their goals with update or add. Changes made by others
+        before are picked up first. If the block raises, the next use
+        rescans. Nested blocks join the outermost one.
+        """
+        if self._locked:
+            yield
+            return
+        with self._lock():
+            self._locked = True
+            try:
+                # Other processes may have written the file meanwhile.
+                self._data = None
+                self._load()
+                self._writing = True
+                yield
+                self._data['directory'] = list(file_stat(self.directory))
+                self._save()
+            finally:
+                self._locked = self._writing = False
+
+    def add(self, names):
+        """Add goals without a summary, it is made on the next use."""
+        goals = self._load()
+        for name in names:
+            goals.setdefault(name, None)
+
+    def update(self, goal):
+        self._load()[goal.name] = self._entry(goal)
+        if not self._writing:
+            self._save()
+
+    def _entry(self, goal):
+        return {
+            'sha': file_sha(self._goal_files(goal.name)[0]),
+            'files': self._files_stat(goal.name),
+            'pledge': goal.pledge,
+            'active': goal.active,
+            'value': goal.value(),
+            'reference_points':
+            [point_to_row(p) for p in goal.reference_points],
+        }
+
+    def summaries(self, load_goals):
+        """Summaries of all goals, loading stale ones with load_goals."""
+        goals = self._load()
+        stale = [
+            name for name, entry in goals.items()
+            if entry is None or entry['files'] != self._files_stat(name)
+        ]
+        if stale:
+            for goal in load_goals(stale):
+                goals[goal.name] = self._entry(goal)
+            self._save()
+        return [self._summary(name, entry) for name, entry in goals.items()]
+
+    def _summary(self, name, entry):
+        return GoalSummary(
+            name=name,
+            pledge=entry['pledge'],
+            active=entry['active'],
+            value=entry['value'],
+            reference_points=tuple(
+                row_to_point(p) for p in entry['reference_points']))
@@ -0,0 +1,443 @@
+from array import array
+from bisect import bisect_left, bisect_right
+import datetime as dt
+import heapq
+import math
+import sys
+from uuid import UUID
+
+EPOCH = dt.datetime(1970, 1, 1)
+ONE_MICROSECOND = dt.timedelta(microseconds=1)
+
+
+def prefix_upper_bound(prefix):
+    """Smallest string that is greater than every string starting with prefix.
+
+    Returns None for the empty prefix, which every string starts with.
+    """
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class PrefixIndex():
+    """Uuids of a set of points in sorted order for prefix lookups.
+
+    Each uuid is stored together with the stamp of its point so that the
+    point can be located in the stamp-sorted datapoints.
+    """
+
+    def __init__(self, points=()):
+        entries = sorted((p.uuid, p.stamp) for p in points)
+        self._uuids = [uuid for uuid, _ in entries]
+        self._stamps = [stamp for _, stamp in entries]
+
+    def __len__(self):
+        return len(self._uuids)
+
+    def add(self, point):
+        i = bisect_right(self._uuids, point.uuid)
+        self._uuids.insert(i, point.uuid)
+        self._stamps.insert(i, point.stamp)
+
+    def discard(self, point):
+        lo = bisect_left(self._uuids, point.uuid)
+        hi = bisect_right(self._uuids, point.uuid, lo)
+        for i in range(lo, hi):
+            if self._stamps[i] == point.stamp:
+                del self._uuids[i]
+                del self._stamps[i]
+                return
+
+    def lookup(self, prefix, limit=None):
+        """Return the (uuid, stamp) pairs matching prefix and their count.
+
+        At most limit pairs are returned, the count covers all matches.
+        """
+        lo = bisect_left(self._uuids, prefix)
+        upper = prefix_upper_bound(prefix)
+        if upper is None:
+            hi = len(self._uuids)
+        else:
+            hi = bisect_left(self._uuids, upper, lo)
+        end = hi if limit is None else min(hi, lo + limit)
+        return list(zip(self._uuids[lo:end], self._stamps[lo:end])), hi - lo
+
+
+class FenwickTree():
+    """Binary indexed tree over a sequence of values for prefix sums."""
+
+    def __init__(self, values=()):
+        self._tree = [0] + list(values)
+        n = len(self._tree)
+        for i in range(1, n):
+            parent = i + (i & -i)
+            if parent < n:
+                self._tree[parent] += self._tree[i]
+
+    def __len__(self):
+        return len(self._tree) - 1
+
+    def append(self, value):
+        i = len(self._tree)
+        low = i - (i & -i)
+        self._tree.append(value + self.prefix_sum(i - 1) -
+                          self.prefix_sum(low))
+
+    def add(self, index, delta):
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, count):
+        """Sum of the first count values."""
+        total = 0
+        while count > 0:
+            total += self._tree[count]
+            count -= count & -count
+        return total
+
+
+class SortedPoints():
+    """Datapoints of a goal, kept in ascending order of their stamp.
+
+    Behaves like the tuple it replaces (indexing, slicing, iteration,
+    comparison and hashing), but inserts by binary search on the stamps
+    instead of re-sorting, and appends without copying when the new point
+    is the latest one.
+
+    Subclasses change how the points are stored by overriding the
+    underscore methods that read, store and delete a single point.
+    """
+
+    def __init__(self, points=()):
+        if isinstance(points, SortedPoints) and type(points) is type(self):
+            self._copy_from(points)
+        else:
+            self._clear()
+            for point in sorted(points, key=lambda p: p.stamp):
+                self._store(len(self), point)
+            self._total = self._sum_values()
+        self._uuid_index = None
+        self._prefix_sums = None
+
+    def _clear(self):
+        self._points = []
+        self._stamps = []
+
+    def _copy_from(self, other):
+        self._points = list(other._points)
+        self._stamps = list(other._stamps)
+        self._total = other._total
+
+    def _sum_values(self):
+        return sum(p.value for p in self._points)
+
+    def _key(self, stamp):
+        return stamp
+
+    def _point(self, i):
+        return self._points[i]
+
+    def _store(self, i, point):
+        self._points.insert(i, point)
+        self._stamps.insert(i, point.stamp)
+
+    def _replace(self, i, point):
+        self._points[i] = point
+
+    def _delete(self, i):
+        del self._points[i]
+        del self._stamps[i]
+
+    def __len__(self):
+        return len(self._stamps)
+
+    def __iter__(self):
+        return iter(self._points)
+
+    def __reversed__(self):
+        return reversed(self._points)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self._points[index])
+        return self._points[index]
+
+    def __contains__(self, point):
+        try:
+            self.index(point)
+        except ValueError:
+            return False
+        return True
+
+    def __eq__(self, other):
+        if isinstance(other, SortedPoints):
+            return len(self) == len(other) and tuple(self) == tuple(other)
+        if isinstance(other, tuple):
+            return tuple(self) == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, tuple(self))
+
+    @property
+    def stamps(self):
+        return self._stamps
+
+    @property
+    def values(self):
+        return [p.value for p in self._points]
+
+    @property
+    def total(self):
+        return self._total
+
+    def columns(self):
+        """The stamps and values as NumPy datetime64[us] and float arrays."""
+        import numpy
+        # Faster than letting NumPy convert the datetimes one by one.
+        stamps = numpy.fromiter(
+            ((stamp - EPOCH) // ONE_MICROSECOND for stamp in self._stamps),
+            dtype='int64',
+            count=len(self))
+        return stamps.view('datetime64[us]'), numpy.fromiter(
+            (p.value for p in self._points), dtype=float, count=len(self))
+
+    def total_until(self, stamp):
+        """Sum of the values of all points not later than stamp.
+
+        The prefix sums are built on the first query, appends and in-place
+        replacements keep them up to date, other inserts and removes drop
+        them until the next query.
+        """
+        if self._prefix_sums is None:
+            self._prefix_sums = FenwickTree(p.value for p in self)
+        return self._prefix_sums.prefix_sum(
+            bisect_right(self._stamps, self._key(stamp)))
+
+    def between(self, since=None, until=None):
+        """Iterate over the points with since <= stamp <= until.
+
+        Either bound may be None for no limit on that side.
+        """
+        return (self._point(i) for i in self._range(since, until))
+
+    def page(self, since=None, until=None, offset=0, limit=None,
+             reverse=False):
+        """Iterate over the points between since and until, latest first
+        with reverse, skipping the first offset and stopping after limit.
+
+        Only the points that are returned are read.
+        """
+        indices = self._range(since, until)
+        if reverse:
+            indices = indices[::-1]
+        stop = None if limit is None else offset + limit
+        return (self._point(i) for i in indices[offset:stop])
+
+    def _range(self, since, until):
+        lo = 0
+        if since is not None:
+            lo = bisect_left(self._stamps, self._key(since))
+        hi = len(self)
+        if until is not None:
+            hi = bisect_right(self._stamps, self._key(until), lo)
+        return range(lo, hi)
+
+    def _stamp_range(self, stamp):
+        key = self._key(stamp)
+        lo = bisect_left(self._stamps, key)
+        return range(lo, bisect_right(self._stamps, key, lo))
+
+    def index(self, point):
+        for i in self._stamp_range(point.stamp):
+            if self._point(i) == point:
+                return i
+        raise ValueError('{} is not in the datapoints'.format(point))
+
+    def get(self, uuid, stamp):
+        for i in self._stamp_range(stamp):
+            point = self._point(i)
+            if point.uuid == uuid:
+                return point
+        raise KeyError(uuid)
+
+    def find(self, prefix, limit=None):
+        """Return the points whose uuid starts with prefix and their count.
+
+        The uuid index is built on the first lookup and kept up to date by
+        insert and remove afterwards.
+        """
+        if self._uuid_index is None:
+            self._uuid_index = PrefixIndex(self)
+        matches, count = self._uuid_index.lookup(prefix, limit)
+        return [self.get(uuid, stamp) for uuid, stamp in matches], count
+
+    def insert(self, point):
+        """Insert point after all points with an earlier or equal stamp."""
+        i = len(self)
+        key = self._key(point.stamp)
+        if i and key < self._stamps[-1]:
+            i = bisect_right(self._stamps, key)
+        self._store(i, point)
+        self._total += point.value
+        if self._uuid_index is not None:
+            self._uuid_index.add(point)
+        if self._prefix_sums is not None:
+            if i == len(self._prefix_sums):
+                self._prefix_sums.append(point.value)
+            else:
+                self._prefix_sums = None
+        return i
+
+    def merge(self, points):
+        """Insert many points with a single linear merge.
+
+        Points with equal stamps end up after the existing ones, as with
+        insert.
+        """
+        points = sorted(points, key=lambda p: p.stamp)
+        if not points:
+            return
+        if len(self) and self._key(points[0].stamp) < self._stamps[-1]:
+            merged = list(heapq.merge(self, points, key=lambda p: p.stamp))
+            self._clear()
+            self._uuid_index = None
+        else:
+            merged = points
+        for point in merged:
+            self._store(len(self), point)
+        if self._uuid_index is not None:
+            for point in points:
+                self._uuid_index.add(point)
+        self._total += sum(p.value for p in points)
+        self._prefix_sums = None
+
+    def remove(self, point):
+        i = self.index(point)
+        self._delete(i)
+        self._total -= point.value
+        if self._uuid_index is not None:
+            self._uuid_index.discard(point)
+        self._prefix_sums = None
+        return i
+
+    def replace(self, old, new):
+        """Replace old by new, which keeps its place if the stamp is equal."""
+        if old.stamp != new.stamp or old.uuid != new.uuid:
+            self.remove(old)
+            return self.insert(new)
+        i = self.index(old)
+        self._replace(i, new)
+        self._total += new.value - old.value
+        if self._prefix_sums is not None:
+            self._prefix_sums.add(i, new.value - old.value)
+        return i
+
+
+class ColumnarPoints(SortedPoints):
+    """Datapoints stored column-wise in compact arrays.
+
+    Stamps are kept as microseconds since the epoch, values as doubles and
+    uuids as two unsigned 64 bit halves. Comments are interned and only
+    stored for points that have one. Point objects are built on access.
+    """
+
+    def _clear(self):
+        self._stamps = array('q')
+        self._values = array('d')
+        self._uuids_high = array('Q')
+        self._uuids_low = array('Q')
+        self._comments = {}
+
+    def _copy_from(self, other):
+        self._stamps = array('q', other._stamps)
+        self._values = array('d', other._values)
+        self._uuids_high = array('Q', other._uuids_high)
+        self._uuids_low = array('Q', other._uuids_low)
+        self._comments = dict(other._comments)
+        self._total = other._total
+
+    def _sum_values(self):
+        return math.fsum(self._values)
+
+    def _key(self, stamp):
+        return (stamp - EPOCH) // ONE_MICROSECOND
+
+    def __iter__(self):
+        return (self._point(i) for i in range(len(self)))
+
+    def __reversed__(self):
+        return (self._point(i) for i in reversed(range(len(self))))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(
+                self._point(i) for i in range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('datapoint index out of range')
+        return self._point(index)
+
+    def _uuid(self, i):
+        return (self._uuids_high[i] << 64) | self._uuids_low[i]
+
+    def _point(self, i):
+        # Imported here since habit.goal depends on this module.
+        from habit.goal import Point
+        uuid = self._uuid(i)
+        return Point(
+            stamp=EPOCH + dt.timedelta(microseconds=self._stamps[i]),
+            value=self._values[i],
+            comment=self._comments.get(uuid, ''),
+            uuid=str(UUID(int=uuid)))
+
+    def _store(self, i, point):
+        uuid = UUID(point.uuid).int
+        self._stamps.insert(i, self._key(point.stamp))
+        self._values.insert(i, point.value)
+        self._uuids_high.insert(i, uuid >> 64)
+        self._uuids_low.insert(i, uuid & 0xffffffffffffffff)
+        if point.comment:
+            self._comments[uuid] = sys.intern(point.comment)
+
+    def _replace(self, i, point):
+        uuid = self._uuid(i)
+        self._values[i] = point.value
+        if point.comment:
+            self._comments[uuid] = sys.intern(point.comment)
+        else:
+            self._comments.pop(uuid, None)
+
+    def _delete(self, i):
+        self._comments.pop(self._uuid(i), None)
+        del self._stamps[i]
+        del self._values[i]
+        del self._uuids_high[i]
+        del self._uuids_low[i]
+
+    @property
+    def stamps(self):
+        return [EPOCH + dt.timedelta(microseconds=s) for s in self._stamps]
+
+    @property
+    def values(self):
+        return self._values
+
+    def columns(self):
+        import numpy
+        stamps = numpy.array(self._stamps, dtype='int64')
+        return stamps.view('datetime64[us]'), numpy.array(self._values)
+
+    def total_until(self, stamp):
+        """Sum of the values of all points not later than stamp."""
+        count = bisect_right(self._stamps, self._key(stamp))
+        if count == len(self):
+            return self._total
+        return math.fsum(self._values[:count])
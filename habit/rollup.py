@@ -0,0 +1,117 @@
+"""Datapoints of a goal summed up per day, week or month.
+
+With NumPy installed the periods are computed on arrays of the stamps and
+values and summed up with bincount, otherwise point by point.
+"""
+from collections import namedtuple
+import datetime as dt
+import math
+
+PERIODS = ('day', 'week', 'month')
+
+Rollup = namedtuple(
+    'Rollup', ['start', 'count', 'sum', 'mean', 'cumulative', 'target'])
+Rollup.__doc__ = """Points of the period starting at the date start.
+
+cumulative is the value of the goal at the end of the period and target
+the value of its reference line then, None outside the reference points.
+mean is None for periods without points.
+"""
+
+
+def period_start(day, by):
+    """The first day of the period of by that day is in."""
+    if by == 'week':
+        return day - dt.timedelta(days=day.weekday())
+    if by == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start, by):
+    if by == 'week':
+        return start + dt.timedelta(days=7)
+    if by == 'month':
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+    return start + dt.timedelta(days=1)
+
+
+def rollup(points, by, schedule=None):
+    """Rollups of points for every period from the first point to the last.
+
+    points is a SortedPoints or one of its kin, by one of PERIODS and
+    schedule the Schedule the targets are taken from.
+    """
+    if by not in PERIODS:
+        raise ValueError('Unknown period {}, use one of {}'.format(
+            by, ', '.join(PERIODS)))
+    if not len(points):
+        return []
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover
+        return _rollup_points(points, by, schedule)
+    return _rollup_columns(numpy, *points.columns(), by, schedule)
+
+
+def _rollup_columns(numpy, stamps, values, by, schedule):
+    days = stamps.astype('datetime64[D]')
+    if by == 'month':
+        periods = stamps.astype('datetime64[M]')
+        step = numpy.timedelta64(1, 'M')
+    elif by == 'week':
+        # The epoch was a Thursday, weeks start on Mondays.
+        periods = days - (days.astype('int64') + 3) % 7
+        step = numpy.timedelta64(7, 'D')
+    else:
+        periods = days
+        step = numpy.timedelta64(1, 'D')
+    starts = numpy.arange(periods.min(), periods.max() + step, step)
+    index = numpy.searchsorted(starts, periods, side='right') - 1
+    sums = numpy.bincount(index, weights=values, minlength=len(starts))
+    counts = numpy.bincount(index, minlength=len(starts))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        means = sums / counts
+    ends = (starts + step).astype('datetime64[us]')
+    targets = numpy.full(len(starts), numpy.nan)
+    if schedule is not None:
+        targets = numpy.asarray(schedule.value_many(ends), dtype=float)
+    return [
+        Rollup(start=start, count=count, sum=total,
+               mean=None if math.isnan(mean) else mean,
+               cumulative=cumulative,
+               target=None if math.isnan(target) else target)
+        for start, count, total, mean, cumulative, target in zip(
+            starts.astype('datetime64[D]').tolist(), counts.tolist(),
+            sums.tolist(), means.tolist(), numpy.cumsum(sums).tolist(),
+            targets.tolist())
+    ]
+
+
+def _rollup_points(points, by, schedule):
+    sums = {}
+    counts = {}
+    for point in points:
+        start = period_start(point.stamp.date(), by)
+        sums[start] = sums.get(start, 0) + point.value
+        counts[start] = counts.get(start, 0) + 1
+    rollups = []
+    cumulative = 0
+    start, last = min(sums), max(sums)
+    while start <= last:
+        end = next_period(start, by)
+        count = counts.get(start, 0)
+        total = sums.get(start, 0.0)
+        cumulative += total
+        target = None
+        if schedule is not None:
+            target = schedule.value(
+                dt.datetime.combine(end, dt.datetime.min.time()))
+        rollups.append(
+            Rollup(start=start, count=count, sum=total,
+                   mean=total / count if count else None,
+                   cumulative=cumulative, target=target))
+        start = end
+    return rollups
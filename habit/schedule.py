@@ -0,0 +1,117 @@
+from bisect import bisect_left
+import datetime as dt
+
+
+def chop_microseconds(delta):
+    return delta - dt.timedelta(microseconds=delta.microseconds)
+
+
+class Schedule():
+    """Piecewise linear line through the reference points of a goal.
+
+    The segments between consecutive reference points are compiled once,
+    the segment that is active at a given time is found by bisection.
+    """
+
+    def __init__(self, reference_points):
+        self._stamps = [p.stamp for p in reference_points]
+        self._values = [p.value for p in reference_points]
+        self._dy = [
+            end - start for start, end in zip(self._values, self._values[1:])
+        ]
+        self._dx = [
+            end - start for start, end in zip(self._stamps, self._stamps[1:])
+        ]
+        self._arrays = None
+
+    def __len__(self):
+        return len(self._dx)
+
+    def segment(self, now):
+        """Index of the first segment that does not end before now.
+
+        Returns None if now is after the last reference point.
+        """
+        end = bisect_left(self._stamps, now, 1)
+        if end >= len(self._stamps):
+            return None
+        return end - 1
+
+    def value(self, now):
+        """Value of the line at now, None outside the reference points."""
+        if not self._stamps or now < self._stamps[0]:
+            return None
+        i = self.segment(now)
+        if i is None:
+            if now == self._stamps[-1]:
+                return self._values[-1]
+            return None
+        return self._values[i] + self._dy[i] * ((now - self._stamps[i]) /
+                                                self._dx[i])
+
+    def value_many(self, nows):
+        """Evaluate value at many times at once.
+
+        With NumPy installed, nows may be a datetime64 array and the
+        result is a float array that is NaN outside the reference points.
+        Otherwise a list is returned.
+        """
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover
+            numpy = None
+        if numpy is None or not len(self):
+            return [self.value(now) for now in nows]
+        stamps = numpy.array(self._stamps, dtype='datetime64[us]').astype(
+            'int64').astype(float)
+        nows = numpy.asarray(nows, dtype='datetime64[us]').astype(
+            'int64').astype(float)
+        return numpy.interp(nows, stamps, self._values, left=numpy.nan,
+                            right=numpy.nan)
+
+    def time_remaining(self, value, now):
+        i = self.segment(now)
+        if i is None:
+            return None
+        delta = (((value - self._values[i]) / self._dy[i]) * self._dx[i]) - (
+            now - self._stamps[i])
+        return chop_microseconds(delta)
+
+    def time_remaining_many(self, values, nows):
+        """Evaluate time_remaining for many pairs of value and time at once.
+
+        With NumPy installed, values and nows may be arrays (nows of
+        datetime64) and the result is a timedelta64[s] array that is NaT
+        after the last reference point and on flat segments. Otherwise a
+        list is returned.
+        """
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover
+            numpy = None
+        if numpy is None or not len(self):
+            return [self.time_remaining(v, n) for v, n in zip(values, nows)]
+        if self._arrays is None:
+            self._arrays = (
+                numpy.array(self._stamps, dtype='datetime64[us]'),
+                numpy.array(self._values, dtype=float),
+                numpy.array(self._dy, dtype=float),
+                numpy.array(self._dx, dtype='timedelta64[us]').astype(float),
+            )
+        stamps, start_values, dy, dx = self._arrays
+        nows = numpy.asarray(nows, dtype='datetime64[us]')
+        values = numpy.asarray(values, dtype=float)
+        segments = numpy.searchsorted(stamps[1:], nows, side='left')
+        after_end = segments >= len(self)
+        segments[after_end] = 0
+        elapsed = (nows - stamps[segments]).astype(float)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            delta = numpy.rint(
+                ((values - start_values[segments]) / dy[segments]) *
+                dx[segments]) - elapsed
+        seconds = numpy.floor_divide(delta, 1e6)
+        undefined = after_end | ~numpy.isfinite(seconds)
+        seconds[undefined] = 0
+        result = seconds.astype('int64').astype('timedelta64[s]')
+        result[undefined] = numpy.timedelta64('NaT')
+        return result
@@ -0,0 +1,467 @@
+"""Goals stored in an SQLite database.
+
+The database lives in a single habit.sqlite file in the store directory
+and keeps no history, use a DataStore for that. Datapoints are not loaded
+into memory but queried from the database, through indexes on the goal
+and stamp for ranges and sums and on the uuid for prefix lookups.
+"""
+import datetime as dt
+import json
+import os
+from habit.goal import Goal, Point, point_to_row, row_to_point
+from habit.manifest import GoalSummary
+from habit.points import EPOCH, ONE_MICROSECOND, SortedPoints
+from habit.points import prefix_upper_bound
+from habit.store import Store
+
+SQLITE_FILENAME = 'habit.sqlite'
+
+SCHEMA = '''
+CREATE TABLE goals (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    pledge NUMERIC NOT NULL,
+    active INTEGER NOT NULL,
+    reference_points TEXT NOT NULL
+);
+CREATE TABLE datapoints (
+    id INTEGER PRIMARY KEY,
+    goal INTEGER NOT NULL REFERENCES goals (id) ON DELETE CASCADE,
+    stamp INTEGER NOT NULL,
+    value REAL NOT NULL,
+    comment TEXT NOT NULL,
+    uuid TEXT NOT NULL
+);
+CREATE INDEX datapoints_goal_stamp ON datapoints (goal, stamp);
+CREATE INDEX datapoints_uuid ON datapoints (uuid);
+'''
+
+
+def stamp_to_key(stamp):
+    """Microseconds since the epoch, the stamp column of the database."""
+    return (stamp - EPOCH) // ONE_MICROSECOND
+
+
+def key_to_stamp(key):
+    return EPOCH + dt.timedelta(microseconds=key)
+
+
+def point_to_record(point):
+    return (stamp_to_key(point.stamp), point.value, point.comment or '',
+            point.uuid)
+
+
+def record_to_point(record):
+    stamp, value, comment, uuid = record
+    return Point(
+        stamp=key_to_stamp(stamp), value=value, comment=comment, uuid=uuid)
+
+
+class SQLitePoints():
+    """Datapoints of a goal that live in the datapoints table.
+
+    Offers the interface of SortedPoints without keeping the points in
+    memory. Points with equal stamps are ordered by insertion. Changes are
+    executed in the open transaction of the connection, which the store
+    commits or rolls back, and unlike with SortedPoints they return
+    nothing.
+    """
+
+    def __init__(self, connection, goal_id):
+        self._connection = connection
+        self._goal = goal_id
+
+    def __reduce__(self):
+        return SortedPoints, (tuple(self), )
+
+    def _select(self, condition='', params=(), order='stamp, id', limit=-1,
+                offset=0):
+        records = self._connection.execute(
+            'SELECT stamp, value, comment, uuid FROM datapoints '
+            'WHERE goal = ? {} ORDER BY {} LIMIT ? OFFSET ?'.format(
+                condition, order),
+            (self._goal, ) + tuple(params) + (limit, offset))
+        return (record_to_point(record) for record in records)
+
+    def _scalar(self, expression, condition='', params=()):
+        return self._connection.execute(
+            'SELECT {} FROM datapoints WHERE goal = ? {}'.format(
+                expression, condition),
+            (self._goal, ) + tuple(params)).fetchone()[0]
+
+    def _id(self, point):
+        record = self._connection.execute(
+            'SELECT id FROM datapoints WHERE goal = ? AND stamp = ? '
+            'AND value = ? AND comment = ? AND uuid = ? LIMIT 1',
+            (self._goal, ) + point_to_record(point)).fetchone()
+        if record is None:
+            raise ValueError('{} is not in the datapoints'.format(point))
+        return record[0]
+
+    def __len__(self):
+        return self._scalar('COUNT(*)')
+
+    def __iter__(self):
+        return self._select()
+
+    def __reversed__(self):
+        return self._select(order='stamp DESC, id DESC')
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return tuple(self)[index]
+            return tuple(
+                self._select(limit=max(0, stop - start), offset=start))
+        if index < 0:
+            index += len(self)
+        if index < 0:
+            raise IndexError('datapoint index out of range')
+        for point in self._select(limit=1, offset=index):
+            return point
+        raise IndexError('datapoint index out of range')
+
+    def __contains__(self, point):
+        try:
+            self._id(point)
+        except ValueError:
+            return False
+        return True
+
+    def __eq__(self, other):
+        if isinstance(other, (SortedPoints, SQLitePoints)):
+            return len(self) == len(other) and tuple(self) == tuple(other)
+        if isinstance(other, tuple):
+            return tuple(self) == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, tuple(self))
+
+    @property
+    def stamps(self):
+        return [p.stamp for p in self]
+
+    @property
+    def values(self):
+        return [p.value for p in self]
+
+    @property
+    def total(self):
+        return self._scalar('COALESCE(SUM(value), 0)')
+
+    def columns(self):
+        """The stamps and values as NumPy arrays, read in a single query."""
+        import numpy
+        records = numpy.array(
+            self._connection.execute(
+                'SELECT stamp, value FROM datapoints WHERE goal = ? '
+                'ORDER BY stamp, id', (self._goal, )).fetchall(),
+            dtype=[('stamp', 'int64'), ('value', float)])
+        return records['stamp'].view('datetime64[us]'), records['value']
+
+    def total_until(self, stamp):
+        """Sum of the values of all points not later than stamp."""
+        return self._scalar('COALESCE(SUM(value), 0)', 'AND stamp <= ?',
+                            (stamp_to_key(stamp), ))
+
+    def between(self, since=None, until=None):
+        """Iterate over the points with since <= stamp <= until."""
+        return self.page(since, until)
+
+    def page(self, since=None, until=None, offset=0, limit=None,
+             reverse=False):
+        """Iterate over the points between since and until, see
+        SortedPoints.page. Offset and limit are applied by the query."""
+        condition, params = '', []
+        if since is not None:
+            condition += ' AND stamp >= ?'
+            params.append(stamp_to_key(since))
+        if until is not None:
+            condition += ' AND stamp <= ?'
+            params.append(stamp_to_key(until))
+        return self._select(
+            condition,
+            params,
+            order='stamp DESC, id DESC' if reverse else 'stamp, id',
+            limit=-1 if limit is None else limit,
+            offset=offset)
+
+    def index(self, point):
+        point_id = self._id(point)
+        return self._scalar(
+            'COUNT(*)', 'AND (stamp < ? OR stamp = ? AND id < ?)',
+            (stamp_to_key(point.stamp), stamp_to_key(point.stamp), point_id))
+
+    def get(self, uuid, stamp):
+        for point in self._select('AND stamp = ? AND uuid = ?',
+                                  (stamp_to_key(stamp), uuid), limit=1):
+            return point
+        raise KeyError(uuid)
+
+    def find(self, prefix, limit=None):
+        """Return the points whose uuid starts with prefix and their count."""
+        condition, params = 'AND uuid >= ?', [prefix]
+        upper = prefix_upper_bound(prefix)
+        if upper is not None:
+            condition += ' AND uuid < ?'
+            params.append(upper)
+        count = self._scalar('COUNT(*)', condition, params)
+        matches = list(
+            self._select(condition, params, order='uuid',
+                         limit=-1 if limit is None else limit))
+        return matches, count
+
+    def insert(self, point):
+        self._connection.execute(
+            'INSERT INTO datapoints (goal, stamp, value, comment, uuid) '
+            'VALUES (?, ?, ?, ?, ?)', (self._goal, ) + point_to_record(point))
+
+    def merge(self, points):
+        """Insert many points with a single statement."""
+        self._connection.executemany(
+            'INSERT INTO datapoints (goal, stamp, value, comment, uuid) '
+            'VALUES (?, ?, ?, ?, ?)',
+            ((self._goal, ) + point_to_record(point)
+             for point in sorted(points, key=lambda p: p.stamp)))
+
+    def remove(self, point):
+        self._connection.execute('DELETE FROM datapoints WHERE id = ?',
+                                 (self._id(point), ))
+
+    def replace(self, old, new):
+        """Replace old by new, which keeps its place if the stamp is equal."""
+        if old.stamp != new.stamp or old.uuid != new.uuid:
+            self.remove(old)
+            self.insert(new)
+            return
+        self._connection.execute(
+            'UPDATE datapoints SET value = ?, comment = ? WHERE id = ?',
+            (new.value, new.comment or '', self._id(old)))
+
+
+class SQLiteStore(Store):
+    """Goals stored in the habit.sqlite database of a directory.
+
+    Goals loaded from the store query their datapoints from the database
+    and change them in place. Every goal update is committed right away,
+    unless a transaction was begun, then they are committed together.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError('{} does not exist'.format(path))
+        if not os.path.isdir(path):
+            raise NotADirectoryError('{} is not a directoy'.format(path))
+        self._path = os.path.abspath(path)
+        self.filename = os.path.join(self._path, SQLITE_FILENAME)
+        if not os.path.isfile(self.filename):
+            raise FileNotFoundError(
+                '{} holds no habit database'.format(path))
+        self._connection = None
+        self._in_transaction = False
+        self._pending = 0
+
+    def init(path):
+        filename = os.path.join(path, SQLITE_FILENAME)
+        if os.path.exists(filename):
+            raise FileExistsError(
+                'Directory {} already holds a habit database.'.format(path))
+        os.makedirs(path, exist_ok=True)
+        import sqlite3
+        connection = sqlite3.connect(filename)
+        try:
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+        return SQLiteStore(path)
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            import sqlite3
+            self._connection = sqlite3.connect(self.filename)
+            self._connection.execute('PRAGMA foreign_keys = ON')
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _goal_id(self, name):
+        record = self.connection.execute('SELECT id FROM goals WHERE name = ?',
+                                         (name, )).fetchone()
+        return None if record is None else record[0]
+
+    def has_goal(self, name):
+        return self._goal_id(name) is not None
+
+    def list_goal_names(self):
+        return [
+            name for name, in self.connection.execute(
+                'SELECT name FROM goals ORDER BY id')
+        ]
+
+    def _goal(self, record):
+        goal_id, name, pledge, active, reference_points = record
+        goal = Goal(
+            name=name,
+            pledge=pledge,
+            active=bool(active),
+            reference_points=tuple(
+                row_to_point(row) for row in json.loads(reference_points)))
+        # Bypasses the datapoints setter, which would copy the points.
+        goal._datapoints = SQLitePoints(self.connection, goal_id)
+        goal.store = self
+        return goal
+
+    def load_goal(self, name, since=None, until=None, at=None):
+        if at is not None:
+            raise ValueError('The SQLite store keeps no history of its goals')
+        record = self.connection.execute(
+            'SELECT id, name, pledge, active, reference_points FROM goals '
+            'WHERE name = ?', (name, )).fetchone()
+        if record is None:
+            raise KeyError(
+                'There is no goal named {} in this store'.format(name))
+        return self._goal(record)
+
+    def load_goals(self, names=None):
+        if names is not None:
+            yield from super().load_goals(names)
+            return
+        records = self.connection.execute(
+            'SELECT id, name, pledge, active, reference_points FROM goals '
+            'ORDER BY id').fetchall()
+        for record in records:
+            yield self._goal(record)
+
+    def goal_summaries(self):
+        """Name, pledge, active flag, value and reference points of all goals.
+
+        The values are summed up by a single query.
+        """
+        records = self.connection.execute(
+            'SELECT name, pledge, active, reference_points, '
+            'COALESCE(SUM(value), 0) FROM goals '
+            'LEFT JOIN datapoints ON datapoints.goal = goals.id '
+            'GROUP BY goals.id ORDER BY goals.id')
+        return [
+            GoalSummary(
+                name=name,
+                pledge=pledge,
+                active=bool(active),
+                value=value,
+                reference_points=tuple(
+                    row_to_point(row) for row in json.loads(reference_points)))
+            for name, pledge, active, reference_points, value in records
+        ]
+
+    def _write_goal_row(self, goal):
+        """Insert or update the row of goal, return its id."""
+        self.connection.execute(
+            'INSERT INTO goals (name, pledge, active, reference_points) '
+            'VALUES (?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET '
+            'pledge = excluded.pledge, active = excluded.active, '
+            'reference_points = excluded.reference_points',
+            (goal.name, goal.pledge, bool(goal.active),
+             json.dumps([point_to_row(p) for p in goal.reference_points])))
+        return self._goal_id(goal.name)
+
+    def _write_datapoints(self, goal_id, points):
+        self.connection.executemany(
+            'INSERT INTO datapoints (goal, stamp, value, comment, uuid) '
+            'VALUES (?, ?, ?, ?, ?)',
+            ((goal_id, ) + point_to_record(point) for point in points))
+
+    def _stored_here(self, goal):
+        points = goal.datapoints
+        return (isinstance(points, SQLitePoints)
+                and points._connection is self._connection)
+
+    def update_goal(self, goal, commit_msg, changes=None):
+        """Store goal, commit_msg is dropped as there is no history.
+
+        Goals loaded from this store already wrote their datapoints.
+        """
+        exists = self.has_goal(goal.name)
+        goal_id = self._write_goal_row(goal)
+        if not self._stored_here(goal):
+            points = SQLitePoints(self.connection, goal_id)
+            if exists and changes:
+                for change in changes:
+                    self._apply_change(points, change)
+            else:
+                self.connection.execute(
+                    'DELETE FROM datapoints WHERE goal = ?', (goal_id, ))
+                self._write_datapoints(goal_id, goal.datapoints)
+        if self._in_transaction:
+            self._pending += 1
+        else:
+            self.connection.commit()
+
+    def _apply_change(self, points, change):
+        operation, point = change
+        if operation == 'add':
+            points.insert(point)
+            return
+        matches, count = points.find(point.uuid, limit=1)
+        if count != 1:
+            raise KeyError('No match for uuid {} found'.format(point.uuid))
+        old = matches[0]
+        if operation == 'remove':
+            points.remove(old)
+        else:
+            points.replace(old, point)
+
+    def import_goals(self, goals, commit_msg):
+        """Insert goals and their datapoints in a single transaction."""
+        count = 0
+        try:
+            for goal in goals:
+                if self.has_goal(goal.name):
+                    raise ValueError(
+                        'A goal with name {} already exists in the store'.
+                        format(goal.name))
+                self._write_datapoints(
+                    self._write_goal_row(goal), goal.datapoints)
+                count += 1
+        except BaseException:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+        return count
+
+    def begin(self):
+        if self._in_transaction:
+            raise RuntimeError('A transaction is already in progress')
+        self._in_transaction = True
+        self._pending = 0
+
+    def rollback(self):
+        self._in_transaction = False
+        self._pending = 0
+        self.connection.rollback()
+
+    def commit(self):
+        self._in_transaction = False
+        self._pending = 0
+        self.connection.commit()
+
+    @property
+    def in_transaction(self):
+        return self._in_transaction
+
+    @property
+    def pending(self):
+        return self._pending if self._in_transaction else 0
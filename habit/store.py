@@ -1,37 +1,554 @@
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
 import os
-from git import Repo
-from habit.goal import Goal
+from habit.cache import GoalCache, files_sha
+from habit.commitqueue import CommitQueue
+from habit.gitobjects import commit_files
+from habit.goal import META_FILENAME, Goal, list_shards, month_of
+from habit.history import GoalHistory
+from habit.journal import Journal
+from habit.manifest import GoalSummary, Manifest
 
+PARALLEL_LOAD_THRESHOLD = 32
 
-class DataStore:
-    def __init__(self, path):
+_worker_store = None
+
+
+def _init_load_worker(path, options):
+    global _worker_store
+    _worker_store = DataStore(path, **options)
+
+
+def _load_in_worker(name):
+    return _worker_store.load_goal(name)
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive advisory lock on the file at path for the block."""
+    import fcntl
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def load_store(path):
+    """The store at path, an SQLite store if it holds a habit database."""
+    from habit.sqlstore import SQLITE_FILENAME, SQLiteStore
+    if os.path.isfile(os.path.join(path, SQLITE_FILENAME)):
+        return SQLiteStore(path)
+    return DataStore(path)
+
+
+def migrate(source, target):
+    """Copy all goals of source into target, one goal at a time.
+
+    Returns the number of goals copied.
+    """
+    return target.import_goals(
+        source.load_goals(), 'Migrated goals from {}'.format(source.path))
+
+
+def combine_messages(messages):
+    """A commit message for a commit of several changes."""
+    if len(messages) == 1:
+        return messages[0]
+    return '{} changes\n\n{}'.format(len(messages), '\n'.join(messages))
+
+
+class Store():
+    """Interface of the backends goals are stored in.
+
+    Goals call has_goal when they are attached to a store and update_goal
+    with the changes they recorded after each modification. The command
+    line interface and the daemon use the rest.
+    """
+
+    @property
+    def path(self):
+        raise NotImplementedError
+
+    def has_goal(self, name):
+        raise NotImplementedError
+
+    def list_goal_names(self):
+        raise NotImplementedError
+
+    def load_goal(self, name, since=None, until=None, at=None):
+        """The goal named name, raises KeyError if there is none.
+
+        since and until let backends skip datapoints outside that range,
+        the goal holds at least the datapoints within it. Backends that
+        keep a history return the goal as it was at a past revision or
+        datetime at, others raise ValueError.
+        """
+        raise NotImplementedError
+
+    def load_goals(self, names=None):
+        """Yield the goals named in names, or all goals, in that order."""
+        names = self.list_goal_names() if names is None else list(names)
+        for name in names:
+            yield self.load_goal(name)
+
+    def goal_summaries(self):
+        return [GoalSummary.of(goal) for goal in self.load_goals()]
+
+    def update_goal(self, goal, commit_msg, changes=None):
+        """Store goal, given the changes made to it since it was stored.
+
+        Without changes the whole goal is written.
+        """
+        raise NotImplementedError
+
+    def import_goals(self, goals, commit_msg):
+        """Add goals that are not in the store yet, return their number."""
+        raise NotImplementedError
+
+    def begin(self):
+        """Start buffering goal updates until commit or rollback."""
+        raise NotImplementedError
+
+    def rollback(self):
+        """Drop the buffered goal updates without writing them."""
+        raise NotImplementedError
+
+    def commit(self):
+        """Write the buffered goal updates together."""
+        raise NotImplementedError
+
+    @property
+    def in_transaction(self):
+        raise NotImplementedError
+
+    @property
+    def pending(self):
+        """Number of goal updates buffered by the current transaction."""
+        raise NotImplementedError
+
+    @contextmanager
+    def transaction(self):
+        """Collect all goal updates of the block into a single commit.
+
+        Goals are written when the block exits. If it raises, nothing is
+        written. Nested transactions join the outermost one.
+        """
+        if self.in_transaction:
+            yield self
+            return
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+
+    def clear_cache(self):
+        pass
+
+    def flush(self):
+        """Make all goal updates so far durable, for backends that delay
+        that."""
+
+    def close(self):
+        """Flush, the store must not be updated afterwards."""
+        self.flush()
+
+
+class DataStore(Store):
+    """Goals stored as YAML files in a git repository.
+
+    Options that are not passed explicitly are read from the habit section
+    of the repository's git config, e.g. ``git config habit.compact true``.
+
+    With a positive journal size, datapoint changes are appended to a
+    ``<name>.journal`` file next to the goal instead of rewriting the goal
+    file, until the journal grows beyond that many bytes and is folded
+    back into the goal file.
+
+    Parsed goals are cached in memory and, unless the cache option is
+    false, pickled below ``.git/habit-cache``, up to cachesize bytes.
+
+    With the shard option, new goals are written into a ``<name>``
+    directory instead, with a ``meta.yaml`` and one file of datapoints
+    per month, so a change only rewrites the shards of the months it
+    touches. Goals that already exist keep their layout.
+
+    Several processes can write to the store at once. Each write holds a
+    lock per goal, below ``.git/habit-locks``, and commits holding a lock
+    on the index. A goal remembers the blob ids of the files it was read
+    from as its base. If the files changed since then, the goal is read
+    again and its changes are applied on top before it is written.
+
+    Commits are written straight into the object database and only the
+    index entries of the changed files are updated, unless the fastcommit
+    option is false, then they go through GitPython's index.
+
+    With the background option, goal files are still written before
+    update_goal returns, but committing them is left to a CommitQueue. It
+    merges the changes of up to commitbatch updates, or of commitinterval
+    seconds, into one commit. Call flush to commit everything written so
+    far, and close when done; open queues are closed at exit. Until then
+    load_goal with at does not see the changes.
+
+    GitPython is only imported once the repository or its config is
+    needed, so read-only commands served from the manifest start fast.
+    """
+
+    def __init__(self,
+                 path,
+                 compact=None,
+                 journal=None,
+                 cache=None,
+                 shard=None,
+                 fastcommit=None,
+                 background=None):
         if not os.path.exists(path):
             raise FileNotFoundError('{} does not exist'.format(path))
         if not os.path.isdir(path):
             raise NotADirectoryError('{} is not a directoy'.format(path))
-        self.repo = Repo(path)
+        self._path = os.path.abspath(path)
+        self._repo = None
+        self._config = None
+        self._options = {
+            'compact': compact,
+            'journal': journal,
+            'cache': cache,
+            'shard': shard,
+            'fastcommit': fastcommit,
+            'background': background
+        }
+        # Given to the stores of load_goals' worker processes.
+        self._arguments = dict(self._options)
+        git_dir = os.path.join(self._path, '.git')
+        self.git_dir = git_dir if os.path.isdir(git_dir) else self.repo.git_dir
+        self._transaction = None
+        self._cache = None
+        self._history = None
+        self._commits = None
+        self.manifest = Manifest(
+            os.path.join(self.git_dir, 'habit-manifest.json'), self.path,
+            self.scan_goal_names, self._goal_files, lambda: file_lock(
+                os.path.join(self.git_dir, 'habit-manifest.lock')))
+
+    @property
+    def repo(self):
+        if self._repo is None:
+            from git import Repo
+            self._repo = Repo(self._path)
+        return self._repo
+
+    def _option(self, name, default):
+        value = self._options.get(name)
+        if value is not None:
+            return value
+        if self._config is None:
+            self._config = self.repo.config_reader()
+        value = self._config.get_value('habit', name, default)
+        self._options[name] = value
+        return value
+
+    @property
+    def compact(self):
+        return self._option('compact', False)
+
+    @property
+    def journal(self):
+        return self._option('journal', 0)
+
+    @property
+    def shard(self):
+        return self._option('shard', False)
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            if self._option('cache', True):
+                self._cache = GoalCache(
+                    os.path.join(self.git_dir, 'habit-cache'),
+                    max_bytes=self._option('cachesize', 64 * 1024 * 1024))
+            else:
+                self._cache = GoalCache(None)
+        return self._cache
+
+    @property
+    def background(self):
+        return self._option('background', False)
+
+    @property
+    def commits(self):
+        """The CommitQueue of the background mode."""
+        if self._commits is None or self._commits.closed:
+            self._commits = CommitQueue(
+                self._commit_locked,
+                interval=self._option('commitinterval', 1.0),
+                batch_size=self._option('commitbatch', 100))
+        return self._commits
+
+    @property
+    def history(self):
+        if self._history is None:
+            self._history = GoalHistory(self.repo)
+        return self._history
 
     @property
     def path(self):
-        return self.repo.working_tree_dir
+        return self._path
 
     def init(path):
         if os.path.exists(os.path.join(path, '.git')):
             raise FileExistsError(
                 'Directory {} is already a git repository.'.format(path))
+        from git import Repo
         Repo.init(path)
         return DataStore(path)
 
-    def update_goal(self, goal, commit_msg):
+    def update_goal(self, goal, commit_msg, changes=None):
+        if self._transaction is not None:
+            self._transaction.add(goal, commit_msg, changes)
+            return
+        with self._locked([goal.name]), self.manifest.writing():
+            self._rebase(goal, changes)
+            self._commit([goal.name], self._write_goal(goal, changes),
+                         commit_msg)
+            self._goal_written(goal)
+
+    def import_goals(self, goals, commit_msg):
+        """Write goals to their files as they come and commit them once.
+
+        The manifest summarizes the new goals on its next use, the cache
+        picks them up when they are loaded.
+        """
+        names = set()
+        paths = []
+        with self.manifest.writing():
+            for goal in goals:
+                if goal.name in names or self.has_goal(goal.name):
+                    raise ValueError(
+                        'A goal with name {} already exists in the store'.
+                        format(goal.name))
+                names.add(goal.name)
+                paths.extend(self.write_snapshot(goal))
+            self.manifest.add(names)
+        if paths:
+            self._commit(names, paths, commit_msg)
+        return len(names)
+
+    def begin(self):
+        if self._transaction is not None:
+            raise RuntimeError('A transaction is already in progress')
+        self._transaction = Transaction()
+
+    def rollback(self):
+        self._transaction = None
+
+    @property
+    def in_transaction(self):
+        return self._transaction is not None
+
+    @property
+    def pending(self):
+        if self._transaction is None:
+            return 0
+        return len(self._transaction.messages)
+
+    def commit(self):
+        transaction, self._transaction = self._transaction, None
+        if transaction is None or not transaction.goals:
+            return
+        with self._locked(transaction.goals), self.manifest.writing():
+            paths = []
+            for name, (goal, changes) in transaction.goals.items():
+                self._rebase(goal, changes, name in transaction.replay)
+                paths.extend(self._write_goal(goal, changes))
+            self._commit(transaction.goals, paths, transaction.message())
+            for goal, _ in transaction.goals.values():
+                self._goal_written(goal)
+
+    @contextmanager
+    def _locked(self, names):
+        """Lock the goals named in names, in sorted order against deadlocks."""
+        directory = os.path.join(self.git_dir, 'habit-locks')
+        os.makedirs(directory, exist_ok=True)
+        with ExitStack() as stack:
+            for name in sorted(set(names)):
+                stack.enter_context(
+                    file_lock(
+                        os.path.join(directory, '{}.lock'.format(name))))
+            yield
+
+    def flush(self):
+        if self._commits is not None:
+            self._commits.flush()
+
+    def close(self):
+        if self._commits is not None:
+            self._commits.close()
+
+    def _commit(self, names, paths, commit_msg):
+        """Commit the written paths of the goals named in names, now or in
+        the background."""
+        if self.background:
+            self.commits.put(names, paths, commit_msg)
+        else:
+            self._commit_index(paths, commit_msg)
+
+    def _commit_locked(self, names, paths, messages):
+        """Commit queued changes, holding the goal locks so that no goal is
+        committed halfway through a write."""
+        with self._locked(names):
+            self._commit_index(paths, combine_messages(messages))
+
+    def _commit_index(self, paths, commit_msg):
+        with file_lock(os.path.join(self.git_dir, 'habit-index.lock')):
+            if self._option('fastcommit', True):
+                commit_files(self.repo, paths, commit_msg)
+                return
+            self._stage(paths)
+            self.repo.index.commit(commit_msg)
+
+    def _rebase(self, goal, changes, replay=False):
+        """Apply changes to the stored goal if another process changed it,
+        or with replay in any case.
+
+        Goals without a base were never written, their files must not
+        exist. The caller holds the lock of the goal.
+        """
+        paths = self._goal_files(goal.name)
+        shas = files_sha(paths)
+        if goal.base is None:
+            if any(shas):
+                raise ValueError(
+                    'A goal with name {} already exists in the store'.format(
+                        goal.name))
+            return
+        if shas == goal.base and not replay:
+            return
+        # Only changes of the datapoints are known and can be replayed.
+        if not changes or (goal.meta_dirty and shas != goal.base):
+            raise RuntimeError(
+                'Goal {} was changed by another process, load it again'.
+                format(goal.name))
+        stored = self.cache.get(goal.name, paths,
+                                lambda: self._parse_goal(goal.name))
+        for change in changes:
+            stored.apply_change(change)
+        goal.datapoints = stored.datapoints
+        if not goal.meta_dirty:
+            goal.pledge = stored.pledge
+            goal.active = stored.active
+            goal.reference_points = stored.reference_points
+            goal.meta_dirty = False
+
+    def _stage(self, paths):
+        """Add the paths to the index, or remove them if they were deleted."""
+        removed = [path for path in paths if not os.path.exists(path)]
+        if removed:
+            self.repo.index.remove(removed, ignore_unmatch=True)
+        self.repo.index.add([path for path in paths if path not in removed])
+
+    def _write_goal(self, goal, changes):
+        """Write the goal or its changes and return the paths to commit."""
+        if self._sharded(goal.name):
+            months = None
+            if changes and self.is_sharded(goal.name):
+                months = {month_of(point.stamp) for _, point in changes}
+            return goal.toShards(
+                self.get_shard_directory(goal.name),
+                months,
+                compact=self.compact)
         filename = self.get_path_to_goal(goal.name)
-        goal.toYAML(filename)
-        self.repo.index.add([filename])
-        self.repo.index.commit(commit_msg)
+        journal = self.get_journal(goal.name)
+        if (self.journal and changes and not goal.meta_dirty
+                and os.path.exists(filename)):
+            journal.append(changes)
+            if journal.size() < self.journal:
+                return [journal.path]
+        return self.write_snapshot(goal)
+
+    def write_snapshot(self, goal):
+        """Write the whole goal to its file and fold the journal into it."""
+        if self._sharded(goal.name):
+            return goal.toShards(
+                self.get_shard_directory(goal.name), compact=self.compact)
+        filename = self.get_path_to_goal(goal.name)
+        goal.toYAML(filename, compact=self.compact)
+        paths = [filename]
+        journal = self.get_journal(goal.name)
+        if journal.size():
+            journal.clear()
+            paths.append(journal.path)
+        return paths
 
     def list_goal_names(self):
+        goals = self.manifest.names()
+        if self._transaction is not None:
+            goals.extend(name for name in self._transaction.goals
+                         if name not in goals)
+        return goals
+
+    def has_goal(self, name):
+        if self._transaction is not None and name in self._transaction.goals:
+            return True
+        return name in self.manifest
+
+    def load_goals(self, names=None, processes=None):
+        """Yield the goals named in names, or all goals, in that order.
+
+        Larger stores are parsed by a pool of processes, one per core by
+        default, that hands out the names in chunks. Fewer than
+        PARALLEL_LOAD_THRESHOLD goals are loaded in this process, where
+        starting a pool would cost more than it saves.
+        """
+        names = self.list_goal_names() if names is None else list(names)
+        processes = min(processes or os.cpu_count() or 1, len(names))
+        if (processes < 2 or len(names) < PARALLEL_LOAD_THRESHOLD
+                or self._transaction is not None):
+            for name in names:
+                yield self.load_goal(name)
+            return
+        import multiprocessing
+        chunksize = max(1, len(names) // (processes * 4))
+        with multiprocessing.Pool(processes, _init_load_worker,
+                                  (self.path, self._arguments)) as pool:
+            for goal in pool.imap(_load_in_worker, names, chunksize):
+                goal.store = self
+                yield goal
+            pool.close()
+            pool.join()
+
+    def goal_summaries(self):
+        """Name, pledge, active flag, value and reference points of all goals.
+
+        They come from the manifest, only goals whose files changed since
+        it was written are loaded.
+        """
+        summaries = self.manifest.summaries(self.load_goals)
+        if self._transaction is None:
+            return summaries
+        pending = OrderedDict(
+            (name, GoalSummary.of(goal))
+            for name, (goal, _) in self._transaction.goals.items())
+        summaries = [pending.pop(s.name, s) for s in summaries]
+        return summaries + list(pending.values())
+
+    def goal_versions(self, name, reverse=False):
+        """Yield (commit, goal) for each commit that changed the goal.
+
+        See GoalHistory.versions, the goals are not attached to the store.
+        """
+        return self.history.versions(name, reverse=reverse)
+
+    def scan_goal_names(self):
         goals = []
         for f in os.listdir(self.path):
             file_path = os.path.join(self.path, f)
+            if os.path.isfile(os.path.join(file_path, META_FILENAME)):
+                goals.append(f)
+                continue
             if not os.path.isfile(file_path):
                 continue
             goal_name, extension = os.path.splitext(f)
@@ -43,10 +560,101 @@ class DataStore:
     def get_path_to_goal(self, name):
         return os.path.join(self.path, '{}.yaml'.format(name))
 
-    def load_goal(self, name):
-        if not name in self.list_goal_names():
+    def get_shard_directory(self, name):
+        return os.path.join(self.path, name)
+
+    def is_sharded(self, name):
+        return os.path.isfile(
+            os.path.join(self.get_shard_directory(name), META_FILENAME))
+
+    def _sharded(self, name):
+        """Whether the goal is, or will be, written in shards."""
+        return self.is_sharded(name) or (
+            self.shard and not os.path.exists(self.get_path_to_goal(name)))
+
+    def get_journal(self, name):
+        return Journal(os.path.join(self.path, '{}.journal'.format(name)))
+
+    def clear_cache(self):
+        self.cache.clear()
+
+    def _goal_files(self, name):
+        if self.is_sharded(name):
+            directory = self.get_shard_directory(name)
+            return (os.path.join(directory, META_FILENAME), ) + tuple(
+                path for _, path in list_shards(directory))
+        return (self.get_path_to_goal(name), self.get_journal(name).path)
+
+    def _goal_written(self, goal):
+        goal.meta_dirty = False
+        self.cache.put(goal.name, self._goal_files(goal.name), goal)
+        goal.base = self.cache.blob_shas(goal.name)
+        self.manifest.update(goal)
+
+    def _parse_goal(self, name):
+        if self.is_sharded(name):
+            return Goal.fromShards(self.get_shard_directory(name))
+        goal = Goal.fromYAML(self.get_path_to_goal(name))
+        self.get_journal(name).replay(goal)
+        return goal
+
+    def load_goal(self, name, since=None, until=None, at=None):
+        """Load the goal named name.
+
+        With since or until, only the shards of a sharded goal that
+        overlap that range are read. Such a goal holds at least the
+        datapoints of the range and is not attached to the store, so it
+        cannot be changed by accident.
+
+        With at, a commit-ish or a datetime, the goal is read as it was
+        committed then, from the object database. It is not attached to
+        the store either.
+        """
+        if at is not None:
+            return self.history.goal_at(name, at)
+        if not self.has_goal(name):
             raise KeyError(
                 'There is no goal named {} in this store'.format(name))
-        goal = Goal.fromYAML(self.get_path_to_goal(name))
+        if self._transaction is not None and name in self._transaction.goals:
+            return self._transaction.goals[name][0]
+        if (since is not None or until is not None) and self.is_sharded(name):
+            return Goal.fromShards(
+                self.get_shard_directory(name), since=since, until=until)
+        goal = self.cache.get(name, self._goal_files(name),
+                              lambda: self._parse_goal(name))
+        goal.base = self.cache.blob_shas(name)
         goal.store = self
         return goal
+
+
+class Transaction():
+    """Goal updates collected by DataStore.transaction."""
+
+    def __init__(self):
+        self.goals = OrderedDict()
+        self.messages = []
+        # Goals updated through more than one object, whose changes must
+        # be replayed onto the stored goal as none of them holds them all.
+        self.replay = set()
+
+    def add(self, goal, commit_msg, changes):
+        """Remember goal and its changes, None meaning the whole goal."""
+        if goal.name in self.goals:
+            other, pending = self.goals[goal.name]
+            if other is not goal:
+                if pending is None or not changes:
+                    raise RuntimeError(
+                        'Goal {} was changed through another object in this '
+                        'transaction, load it again'.format(goal.name))
+                self.replay.add(goal.name)
+            if pending is not None and changes:
+                pending.extend(changes)
+            else:
+                pending = None
+        else:
+            pending = list(changes) if changes else None
+        self.goals[goal.name] = (goal, pending)
+        self.messages.append(commit_msg)
+
+    def message(self):
+        return combine_messages(self.messages)
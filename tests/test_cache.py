@@ -0,0 +1,107 @@
+import os
+import pickle
+import pytest
+import habit.cache
+from habit.cache import GoalCache, blob_sha
+from tests.test_goal import dummy_goal, one_goal, tmpfile  # noqa: F401
+from tests.test_store import empty_folder  # noqa: F401
+
+
+def test_blob_sha_matches_git():
+    assert blob_sha(b'') == 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391'
+
+
+@pytest.fixture
+def cache(empty_folder):
+    return GoalCache(os.path.join(empty_folder, 'cache'))
+
+
+@pytest.fixture
+def counting_parse(one_goal, tmpfile):
+    one_goal.toYAML(tmpfile)
+    calls = []
+
+    def parse():
+        calls.append(1)
+        return one_goal
+
+    parse.calls = calls
+    return parse
+
+
+def test_cache_parses_a_goal_once(cache, counting_parse, tmpfile, one_goal):
+    first = cache.get('Dummy', [tmpfile], counting_parse)
+    second = cache.get('Dummy', [tmpfile], counting_parse)
+    assert first == second == one_goal
+    assert first is not second
+    assert len(counting_parse.calls) == 1
+
+
+def test_disk_cache_survives_a_new_process(cache, counting_parse, tmpfile):
+    cache.get('Dummy', [tmpfile], counting_parse)
+    new_cache = GoalCache(cache.directory)
+    new_cache.get('Dummy', [tmpfile], counting_parse)
+    assert len(counting_parse.calls) == 1
+
+
+def test_put_only_caches_in_memory(cache, counting_parse, tmpfile, one_goal):
+    cache.put('Dummy', [tmpfile], one_goal)
+    assert cache.get('Dummy', [tmpfile], counting_parse) == one_goal
+    assert not os.path.exists(cache.directory)
+    GoalCache(cache.directory).get('Dummy', [tmpfile], counting_parse)
+    assert len(counting_parse.calls) == 1
+    assert len(os.listdir(cache.directory)) == 1
+
+
+def test_cache_notices_changed_files(cache, counting_parse, tmpfile):
+    cache.get('Dummy', [tmpfile], counting_parse)
+    with open(tmpfile, 'a') as f:
+        f.write('\n')
+    cache.get('Dummy', [tmpfile], counting_parse)
+    assert len(counting_parse.calls) == 2
+
+
+def test_disk_cache_is_bounded(cache, counting_parse, tmpfile):
+    cache.max_bytes = 1
+    cache.get('Dummy', [tmpfile], counting_parse)
+    assert os.listdir(cache.directory) == []
+
+
+def test_clear_empties_the_cache(cache, counting_parse, tmpfile):
+    cache.get('Dummy', [tmpfile], counting_parse)
+    cache.clear()
+    assert os.listdir(cache.directory) == []
+    cache.get('Dummy', [tmpfile], counting_parse)
+    assert len(counting_parse.calls) == 2
+
+
+def test_disk_cache_keys_change_with_the_format(cache, counting_parse,
+                                                tmpfile, monkeypatch):
+    cache.get('Dummy', [tmpfile], counting_parse)
+    monkeypatch.setattr(habit.cache, 'CACHE_FORMAT', -1)
+    GoalCache(cache.directory).get('Dummy', [tmpfile], counting_parse)
+    assert len(counting_parse.calls) == 2
+
+
+@pytest.mark.parametrize('content', [b'not a pickle', pickle.dumps(object())])
+def test_disk_cache_drops_unusable_pickles(cache, counting_parse, tmpfile,
+                                           content):
+    cache.get('Dummy', [tmpfile], counting_parse)
+    filename, = os.listdir(cache.directory)
+    with open(os.path.join(cache.directory, filename), 'wb') as f:
+        f.write(content)
+    new_cache = GoalCache(cache.directory)
+    assert new_cache.get('Dummy', [tmpfile], counting_parse).name == 'Dummy'
+    assert len(counting_parse.calls) == 2
+
+
+def test_disk_cache_ignores_pickles_removed_meanwhile(
+        cache, counting_parse, tmpfile, monkeypatch):
+    cache.get('Dummy', [tmpfile], counting_parse)
+    entries = cache._entries()
+    for entry in entries:
+        os.remove(entry.path)
+    monkeypatch.setattr(cache, '_entries', lambda: entries)
+    cache.max_bytes = 0
+    cache._evict()
+    cache.clear()
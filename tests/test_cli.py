@@ -1,7 +1,11 @@
 from click.testing import CliRunner
+import habit
 from habit.cli import main
 from habit.goal import Goal, create_goal
+import json
 import os
+import subprocess
+import sys
 import pytest
 import datetime as dt
 
@@ -151,3 +155,176 @@ def test_can_edit_datapoint_time(run_in_one_goal_store_with_one_point):
     goal = Goal.fromYAML('dummy.yaml')
     point = goal.datapoints[0]
     assert abs(point.stamp-dt.datetime.now()+dt.timedelta(minutes=1)) < dt.timedelta(seconds=5)
+
+
+@pytest.fixture
+def berlin_time():
+    """Run in a timezone that is not UTC, as local times are expected."""
+    import time
+    tz = os.environ.get('TZ')
+    os.environ['TZ'] = 'Europe/Berlin'
+    time.tzset()
+    yield
+    if tz is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = tz
+    time.tzset()
+
+
+def test_can_import_datapoints_from_csv(run_in_one_goal_store, berlin_time):
+    run = run_in_one_goal_store
+    with open('points.csv', 'w') as f:
+        f.write('stamp,value,comment\n')
+        f.write('2019-06-19T12:00:00+00:00,2,later\n')
+        f.write('1560859200,1,\n')
+        f.write('2019-06-20T12:00:00,3,\n')
+        f.write('20190621,4,\n')
+    result = run.invoke(main, ['import', 'dummy', 'points.csv'])
+    assert result.exit_code == 0
+    assert 'Imported 4 points' in result.output
+    goal = Goal.fromYAML('dummy.yaml')
+    assert [p.value for p in goal.datapoints] == [1, 2, 3, 4]
+    assert [p.stamp for p in goal.datapoints] == [
+        dt.datetime(2019, 6, 18, 14),
+        dt.datetime(2019, 6, 19, 14),
+        dt.datetime(2019, 6, 20, 12),
+        dt.datetime(2019, 6, 21)
+    ]
+    assert goal.datapoints[1].comment == 'later'
+
+
+def test_can_import_datapoints_from_json_lines(run_in_one_goal_store):
+    run = run_in_one_goal_store
+    with open('points.jsonl', 'w') as f:
+        f.write('{"stamp": "2019-06-18T12:00:00", "value": 1}\n')
+        f.write('{"stamp": "2019-06-19T12:00:00", "value": 2}\n')
+    result = run.invoke(main, ['import', 'dummy', 'points.jsonl'])
+    assert result.exit_code == 0
+    assert len(Goal.fromYAML('dummy.yaml').datapoints) == 2
+
+
+def test_import_fails_for_invalid_records(run_in_one_goal_store):
+    run = run_in_one_goal_store
+    with open('points.csv', 'w') as f:
+        f.write('stamp,value\n')
+        f.write('2019-06-18T12:00:00,foo\n')
+    result = run.invoke(main, ['import', 'dummy', 'points.csv'])
+    assert result.exit_code == 1
+    assert 'Invalid record 1' in result.output
+    assert len(Goal.fromYAML('dummy.yaml').datapoints) == 0
+
+
+def test_cache_clear(run_in_one_goal_store):
+    run = run_in_one_goal_store
+    run.invoke(main, ['list', 'dummy'])
+    assert os.listdir(os.path.join('.git', 'habit-cache'))
+    result = run.invoke(main, ['cache', 'clear'])
+    assert result.exit_code == 0
+    assert 'Cache cleared' in result.output
+    assert not os.listdir(os.path.join('.git', 'habit-cache'))
+
+
+def test_can_list_datapoints_at_a_past_commit(
+        run_in_one_goal_store_with_one_point):
+    run = run_in_one_goal_store_with_one_point
+    run.invoke(main, ['add', 'dummy', '20', '-c', 'later'])
+    result = run.invoke(main, ['list', 'dummy', '--at', 'HEAD~1'])
+    assert result.exit_code == 0
+    assert 'test' in result.output
+    assert 'later' not in result.output
+    result = run.invoke(main, ['list', 'dummy', '--at', 'in one hour'])
+    assert result.exit_code == 0
+    assert 'later' in result.output
+    result = run.invoke(main, ['list', 'dummy', '--at', 'nonsense'])
+    assert result.exit_code == 1
+    assert 'does not name a commit' in result.output
+
+
+@pytest.fixture
+def run_in_store_with_points(run_in_one_goal_store):
+    run = run_in_one_goal_store
+    with open('points.csv', 'w') as f:
+        f.write('stamp,value,comment\n')
+        for day in range(1, 6):
+            f.write('2019-06-0{}T12:00:00,{},day {}\n'.format(day, day, day))
+    run.invoke(main, ['import', 'dummy', 'points.csv'])
+    yield run
+
+
+def test_list_filters_and_pages_the_points(run_in_store_with_points):
+    run = run_in_store_with_points
+    result = run.invoke(main, [
+        'list', 'dummy', '--since', '2019-06-02', '--until',
+        '2019-06-04 23:00', '--reverse', '--limit', '2'
+    ])
+    assert result.exit_code == 0
+    assert 'day 4' in result.output and 'day 3' in result.output
+    assert result.output.index('day 4') < result.output.index('day 3')
+    for day in (1, 2, 5):
+        assert 'day {}'.format(day) not in result.output
+    result = run.invoke(main, ['list', 'dummy', '--offset', '4'])
+    assert 'day 5' in result.output and 'day 4' not in result.output
+    result = run.invoke(main, ['list', 'dummy', '--since', 'nonsense'])
+    assert result.exit_code == 2
+
+
+def test_list_streams_tsv_and_json_lines(run_in_store_with_points):
+    run = run_in_store_with_points
+    goal = Goal.fromYAML('dummy.yaml')
+    result = run.invoke(main, ['list', 'dummy', '-f', 'tsv', '--limit', '2'])
+    assert result.exit_code == 0
+    assert result.output.splitlines() == [
+        'uuid\tvalue\tstamp\tcomment',
+        '{}\t1.0\t2019-06-01T12:00:00\tday 1'.format(
+            goal.datapoints[0].uuid),
+        '{}\t2.0\t2019-06-02T12:00:00\tday 2'.format(
+            goal.datapoints[1].uuid),
+    ]
+    result = run.invoke(main, ['list', 'dummy', '-f', 'jsonl'])
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert [r['comment'] for r in records] == [
+        'day {}'.format(day) for day in range(1, 6)]
+    assert records[0]['uuid'] == goal.datapoints[0].uuid
+
+
+def test_stats_sum_up_the_points_per_period(
+        run_in_one_goal_store_with_one_point):
+    run = run_in_one_goal_store_with_one_point
+    run.invoke(main, ['add', 'dummy', '5'])
+    result = run.invoke(main, ['stats', 'dummy', '--by', 'week'])
+    assert result.exit_code == 0
+    monday = dt.date.today() - dt.timedelta(days=dt.date.today().weekday())
+    assert monday.isoformat() in result.output
+    assert '15.00' in result.output
+    result = run.invoke(main, ['stats', 'dummy', '--by', 'year'])
+    assert result.exit_code == 2
+
+
+def test_sqlite_store_and_migration(runner):
+    result = runner.invoke(main, ['init', '--backend', 'sqlite'])
+    assert result.exit_code == 0
+    assert os.path.exists('habit.sqlite')
+    runner.invoke(main, ['new', 'dummy'])
+    result = runner.invoke(main, ['add', 'dummy', '3', '-c', 'stored'])
+    assert result.exit_code == 0
+    assert 'stored' in runner.invoke(main, ['list', 'dummy']).output
+    result = runner.invoke(main, ['migrate', 'git', '--backend', 'git'])
+    assert result.exit_code == 0
+    assert 'Migrated 1 goals' in result.output
+    goal = Goal.fromYAML(os.path.join('git', 'dummy.yaml'))
+    assert goal.datapoints[0].comment == 'stored'
+    result = runner.invoke(main, ['migrate', 'git', '--backend', 'git'])
+    assert result.exit_code == 1
+
+
+def test_cli_does_not_import_heavy_dependencies_at_startup():
+    code = ('import sys, habit.cli; print(",".join(sorted(m for m in '
+            '("dateparser", "git", "tabulate", "yaml", "dateutil") '
+            'if m in sys.modules)))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(habit.__file__)))
+    output = subprocess.check_output([sys.executable, '-c', code],
+                                     cwd=root,
+                                     universal_newlines=True)
+    assert output.strip() == ''
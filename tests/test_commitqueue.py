@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+import threading
+import pytest
+from habit.commitqueue import CommitQueue
+from habit.goal import Goal, create_point
+from habit.store import DataStore
+from tests.test_goal import dummy_goal  # noqa: F401
+from tests.test_store import empty_folder  # noqa: F401
+
+
+class Recorder():
+    def __init__(self, fail=False):
+        self.commits = []
+        self.fail = fail
+        self.committed = threading.Event()
+
+    def __call__(self, names, paths, messages):
+        if self.fail:
+            raise OSError('disk full')
+        self.commits.append((names, paths, messages))
+        self.committed.set()
+
+
+def test_flush_commits_the_queued_changes_at_once():
+    recorder = Recorder()
+    queue = CommitQueue(recorder, interval=60)
+    queue.put(['a'], ['a.yaml'], 'first')
+    queue.put(['b', 'a'], ['b.yaml', 'a.yaml'], 'second')
+    assert len(queue) == 2
+    queue.flush()
+    assert recorder.commits == [(['a', 'b'], ['a.yaml', 'b.yaml'],
+                                 ['first', 'second'])]
+    assert len(queue) == 0
+    queue.close()
+
+
+def test_worker_commits_full_batches():
+    recorder = Recorder()
+    queue = CommitQueue(recorder, interval=60, batch_size=2)
+    queue.put(['a'], ['a.yaml'], 'first')
+    assert not recorder.committed.wait(0.1)
+    queue.put(['a'], ['a.yaml'], 'second')
+    assert recorder.committed.wait(5)
+    assert recorder.commits[0][2] == ['first', 'second']
+    queue.close()
+
+
+def test_worker_commits_after_the_interval():
+    recorder = Recorder()
+    queue = CommitQueue(recorder, interval=0.05)
+    queue.put(['a'], ['a.yaml'], 'first')
+    assert recorder.committed.wait(5)
+    queue.close()
+
+
+def test_failed_commits_stay_queued():
+    recorder = Recorder(fail=True)
+    queue = CommitQueue(recorder, interval=60)
+    queue.put(['a'], ['a.yaml'], 'first')
+    with pytest.raises(OSError):
+        queue.flush()
+    assert len(queue) == 1
+    recorder.fail = False
+    queue.close()
+    assert recorder.commits == [(['a'], ['a.yaml'], ['first'])]
+    with pytest.raises(RuntimeError):
+        queue.put(['a'], ['a.yaml'], 'second')
+
+
+@pytest.fixture
+def background_store(empty_folder, dummy_goal):
+    DataStore.init(empty_folder)
+    store = DataStore(empty_folder, background=True)
+    store.commits.interval = 60
+    dummy_goal.set_store(store)
+    store.flush()
+    return store
+
+
+def test_files_are_written_before_the_commit(background_store):
+    head = background_store.repo.head.commit
+    goal = background_store.load_goal('Dummy')
+    goal.add_point(create_point(value=1))
+    goal.add_point(create_point(value=2))
+    stored = Goal.fromYAML(background_store.get_path_to_goal('Dummy'))
+    assert stored.value() == 3
+    assert background_store.repo.head.commit == head
+    background_store.flush()
+    commit = background_store.repo.head.commit
+    assert commit.parents == (head, )
+    assert commit.message.startswith('2 changes')
+    assert not background_store.repo.is_dirty(untracked_files=True)
+    assert background_store.load_goal('Dummy', at='HEAD') == goal
+    background_store.close()
+
+
+def test_queued_commits_are_flushed_at_exit(background_store):
+    code = ('import sys; from habit.store import DataStore; '
+            'from habit.goal import create_point; '
+            'store = DataStore(sys.argv[1], background=True); '
+            'store.commits.interval = 60; '
+            'goal = store.load_goal("Dummy"); goal.defer(); '
+            'goal.add_point(create_point(value=2)); '
+            'goal.add_point(create_point(value=3))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.check_call([sys.executable, '-c', code, background_store.path],
+                          cwd=root)
+    assert background_store.load_goal('Dummy', at='HEAD').value() == 5
+    assert not background_store.repo.is_dirty(untracked_files=True)
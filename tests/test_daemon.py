@@ -0,0 +1,144 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+import pytest
+import habit
+from habit.cli import main
+from habit.daemon import (MAX_SOCKET_PATH, Daemon, forward, send_message,
+                          socket_path)
+from habit.goal import Goal
+from habit.store import DataStore
+from tests.test_cli import (  # noqa: F401
+    runner, run_in_store, run_in_one_goal_store)
+
+
+def start_daemon(*options):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(habit.__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p])
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'habit.cli', 'serve'] + list(options),
+        env=env,
+        stdout=subprocess.DEVNULL)
+    path = socket_path(os.getcwd())
+    for _ in range(200):
+        if os.path.exists(path):
+            break
+        time.sleep(0.05)
+    return process
+
+
+def stop_daemon(process):
+    process.terminate()
+    process.wait(10)
+
+
+@pytest.fixture
+def daemon_process(run_in_one_goal_store):
+    process = start_daemon('--flush-interval', '60')
+    yield process
+    if process.poll() is None:
+        stop_daemon(process)
+
+
+@pytest.fixture
+def daemon(run_in_one_goal_store, daemon_process):
+    return run_in_one_goal_store
+
+
+def test_no_daemon_is_running_by_default(run_in_one_goal_store):
+    assert forward(os.getcwd(), ['goals']) is None
+
+
+@pytest.fixture
+def hung_daemon(run_in_one_goal_store):
+    """A socket that accepts requests but never answers them."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(socket_path(os.getcwd()))
+        sock.listen(1)
+        yield run_in_one_goal_store
+
+
+def test_hung_daemon_is_not_waited_for(hung_daemon):
+    assert forward(os.getcwd(), ['goals'], timeout=0.1) is None
+
+
+def test_changes_sent_to_a_hung_daemon_are_not_run_again(hung_daemon):
+    with pytest.raises(RuntimeError, match='did not answer'):
+        forward(os.getcwd(), ['add', 'dummy', '1'], timeout=0.1)
+    assert len(Goal.fromYAML('dummy.yaml').datapoints) == 0
+
+
+def test_daemon_survives_clients_that_went_away(run_in_one_goal_store):
+    calls = []
+
+    def run_command(args, store):
+        calls.append(args)
+        return 'output', 0
+
+    server = Daemon(DataStore(os.getcwd()), run_command)
+    client, connection = socket.socketpair()
+    with connection:
+        send_message(client, {'args': ['goals']})
+        client.close()
+        server._handle(connection)
+    assert calls == [['goals']]
+
+
+def test_long_socket_paths_are_private(tmpdir, monkeypatch):
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setattr('tempfile.tempdir', str(tmpdir))
+    path = socket_path(str(tmpdir.join('a' * MAX_SOCKET_PATH)))
+    directory = os.path.dirname(path)
+    assert os.path.dirname(directory) == str(tmpdir)
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    os.chmod(directory, 0o755)
+    with pytest.raises(RuntimeError):
+        socket_path(str(tmpdir.join('a' * MAX_SOCKET_PATH)))
+
+
+def test_sockets_of_other_users_are_ignored(hung_daemon, monkeypatch):
+    monkeypatch.setattr('os.getuid', lambda: os.stat('.').st_uid + 1)
+    assert forward(os.getcwd(), ['add', 'dummy', '1'], timeout=0.1) is None
+
+
+def test_commands_are_forwarded_to_the_daemon(daemon):
+    assert forward(os.getcwd(), ['goals'])['exit_code'] == 0
+    result = daemon.invoke(main, ['add', 'dummy', '10', '-c', 'served'])
+    assert result.exit_code == 0
+    assert 'added successfully' in result.output
+    result = daemon.invoke(main, ['list', 'dummy'])
+    assert 'served' in result.output
+    result = daemon.invoke(main, ['goals'])
+    assert 'dummy' in result.output
+
+
+def test_daemon_reports_errors(daemon):
+    result = daemon.invoke(main, ['remove', 'dummy', 'nonexistent'])
+    assert result.exit_code == 1
+    assert 'No match' in result.output
+    result = daemon.invoke(main, ['list', 'missing'])
+    assert result.exit_code == 1
+
+
+def test_daemon_commits_buffered_changes_at_once(daemon, daemon_process):
+    store = DataStore(os.getcwd())
+    head = store.repo.head.commit
+    for value in range(3):
+        daemon.invoke(main, ['add', 'dummy', str(value)])
+    assert len(Goal.fromYAML('dummy.yaml').datapoints) == 0
+    stop_daemon(daemon_process)
+    assert not os.path.exists(socket_path(os.getcwd()))
+    assert len(Goal.fromYAML('dummy.yaml').datapoints) == 3
+    assert store.repo.head.commit.parents[0] == head
+    assert store.repo.head.commit.message.startswith('3 changes')
+    assert not store.repo.is_dirty(untracked_files=True)
+
+
+def test_second_daemon_refuses_to_start(daemon, daemon_process):
+    process = start_daemon()
+    assert process.wait(10) == 1
+    assert daemon_process.poll() is None
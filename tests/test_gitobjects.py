@@ -0,0 +1,58 @@
+import os
+from git import Repo
+from habit.gitobjects import commit_files, parse_tree, serialize_tree
+from tests.test_store import empty_folder  # noqa: F401
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def assert_clean(repo):
+    assert repo.git.status('--porcelain') == ''
+    repo.git.fsck('--strict')
+    assert repo.git.write_tree() == repo.head.commit.tree.hexsha
+
+
+def test_tree_round_trip_keeps_git_order():
+    entries = {
+        'a.b': (0o100644, b'1' * 20),
+        'a': (0o040000, b'2' * 20),
+        'a0': (0o100644, b'3' * 20)
+    }
+    data = serialize_tree(entries)
+    assert parse_tree(data) == entries
+    assert data.index(b'a.b') < data.index(b'40000 a\0') < data.index(b'a0')
+
+
+def test_commit_files_creates_commits(empty_folder):
+    repo = Repo.init(empty_folder)
+    first = os.path.join(empty_folder, 'goal', 'meta.yaml')
+    second = os.path.join(empty_folder, 'goal', '2019-06.yaml')
+    write(first, 'name: goal\n')
+    write(second, 'points\n')
+    commit = commit_files(repo, [first, second], 'Add goal')
+    assert repo.head.commit == commit
+    assert commit.message == 'Add goal'
+    assert_clean(repo)
+
+
+def test_commit_files_patches_and_removes_entries(empty_folder):
+    repo = Repo.init(empty_folder)
+    first = os.path.join(empty_folder, 'goal', 'meta.yaml')
+    second = os.path.join(empty_folder, 'other.yaml')
+    write(first, 'name: goal\n')
+    write(second, 'name: other\n')
+    commit_files(repo, [first, second], 'Add goals')
+    write(first, 'name: goal\npledge: 1\n')
+    commit = commit_files(repo, [first], 'Change goal')
+    assert commit.parents[0].message == 'Add goals'
+    assert (commit.tree / 'goal/meta.yaml').data_stream.read() == (
+        b'name: goal\npledge: 1\n')
+    assert_clean(repo)
+    os.remove(first)
+    commit = commit_files(repo, [first], 'Remove goal')
+    assert [blob.path for blob in commit.tree.traverse()] == ['other.yaml']
+    assert_clean(repo)
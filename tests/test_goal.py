@@ -1,5 +1,5 @@
 import pytest
-from habit.goal import Goal, Point, create_goal, create_point
+from habit.goal import Goal, Point, create_goal, create_point, MAX_LISTED_MATCHES
 import datetime as dt
 from dateutil.relativedelta import relativedelta
 import tempfile
@@ -222,3 +222,134 @@ def test_can_edit_datapoint_with_part_of_hash(one_goal):
     one_goal.edit_point(point.uuid[:5],comment='foo')
     point = one_goal.datapoints[0]
     assert point.comment == 'foo'
+
+
+def test_ambiguous_uuid_error_lists_a_bounded_number_of_matches(dummy_goal):
+    for i in range(MAX_LISTED_MATCHES + 5):
+        dummy_goal.add_point(create_point(stamp=dt.datetime.now(), value=i))
+    with pytest.raises(KeyError) as e:
+        dummy_goal.find_datapoint('')
+    message = str(e.value)
+    assert message.count(',') == MAX_LISTED_MATCHES
+    assert 'and 5 more' in message
+
+
+def test_value_at_a_past_time(dummy_goal):
+    now = dt.datetime.now()
+    dummy_goal.add_point(create_point(stamp=now, value=1))
+    dummy_goal.add_point(
+        create_point(stamp=now - relativedelta(days=1), value=10))
+    assert dummy_goal.value(at=now - relativedelta(hours=1)) == 10
+    assert dummy_goal.value(at=now) == 11
+    assert dummy_goal.value(at=now - relativedelta(days=2)) == 0
+
+
+def test_schedule_is_rebuilt_when_reference_points_are_added(one_goal):
+    now = dt.datetime.now()
+    one_goal.time_remaining(now)
+    one_goal.add_reference_point(
+        create_point(stamp=now + relativedelta(hours=1), value=1))
+    assert abs(one_goal.time_remaining(now) -
+               dt.timedelta(hours=1)) < dt.timedelta(seconds=1)
+
+
+def test_time_remaining_series_uses_the_value_at_each_time(dummy_goal):
+    now = dt.datetime.now()
+    dummy_goal.add_point(create_point(stamp=now, value=1))
+    before, after = now - relativedelta(seconds=1), now
+    series = dummy_goal.time_remaining_series([before, after])
+    assert [dt.timedelta(seconds=int(d / dt.timedelta(seconds=1)))
+            for d in series] == [
+        dummy_goal.schedule.time_remaining(0, before),
+        dummy_goal.schedule.time_remaining(1, after)
+    ]
+
+
+def test_can_parse_columnar_goal_from_yaml(one_goal, tmpfile):
+    one_goal.toYAML(tmpfile)
+    clone = Goal.fromYAML(tmpfile, columnar=True)
+    assert clone.columnar
+    assert one_goal == clone
+    assert clone.value() == one_goal.value()
+
+
+def test_can_parse_goal_from_compact_yaml(one_goal, tmpfile):
+    point = create_point(
+        stamp=dt.datetime.now() - relativedelta(days=1), value=2.5,
+        comment='with: colon')
+    one_goal.add_point(point)
+    one_goal.toYAML(tmpfile, compact=True)
+    with open(tmpfile) as f:
+        data = yaml.safe_load(f)
+    assert data.get('datapoints')[0][2:] == ['with: colon', point.uuid]
+    clone = Goal.fromYAML(tmpfile)
+    assert one_goal == clone
+
+
+def test_compact_yaml_keeps_microseconds(dummy_goal, tmpfile):
+    point = create_point(
+        stamp=dt.datetime(2019, 6, 18, 12, 0, 0, 123456), value=1)
+    dummy_goal.add_point(point)
+    dummy_goal.toYAML(tmpfile, compact=True)
+    assert Goal.fromYAML(tmpfile).datapoints[0] == point
+
+
+def test_add_points_merges_them_in_time_order(one_goal):
+    now = dt.datetime.now()
+    points = [
+        create_point(stamp=now + relativedelta(days=1), value=2),
+        create_point(stamp=now - relativedelta(days=1), value=3),
+    ]
+    existing = one_goal.datapoints[0]
+    one_goal.add_points(points)
+    assert one_goal.datapoints == (points[1], existing, points[0])
+    assert one_goal.value() == 6
+    assert one_goal.find_datapoint(points[0].uuid) == points[0]
+
+
+def test_goal_can_be_written_to_and_read_from_shards(dummy_goal):
+    for month in (1, 2, 12):
+        dummy_goal.add_point(
+            create_point(stamp=dt.datetime(2019, month, 3), value=month))
+    directory = tempfile.mkdtemp()
+    paths = dummy_goal.toShards(directory, compact=True)
+    assert sorted(os.path.basename(p) for p in paths) == [
+        '2019-01.yaml', '2019-02.yaml', '2019-12.yaml', 'meta.yaml'
+    ]
+    assert Goal.fromShards(directory) == dummy_goal
+    goal = Goal.fromShards(
+        directory,
+        since=dt.datetime(2019, 2, 28),
+        until=dt.datetime(2019, 3, 1))
+    assert [p.value for p in goal.datapoints] == [2]
+
+
+def test_every_change_bumps_the_version(dummy_goal):
+    version = dummy_goal.version
+    point = create_point(stamp=dt.datetime.now(), value=1)
+    dummy_goal.add_point(point)
+    dummy_goal.edit_point(point.uuid, value=2)
+    dummy_goal.remove_point(point.uuid)
+    dummy_goal.add_points([point])
+    dummy_goal.pledge = 5
+    dummy_goal.active = False
+    dummy_goal.add_reference_point(point)
+    assert dummy_goal.version == version + 7
+
+
+def test_hash_is_cached_until_the_goal_changes(dummy_goal):
+    first = hash(dummy_goal)
+    assert dummy_goal._hash == first
+    dummy_goal.add_point(create_point(stamp=dt.datetime.now(), value=1))
+    assert dummy_goal._hash is None
+    assert hash(dummy_goal) != first
+
+
+def test_goals_with_different_fields_are_not_equal(dummy_goal):
+    other = dummy_goal.copy()
+    assert other == dummy_goal
+    other.pledge = 1
+    assert other != dummy_goal
+    other = dummy_goal.copy()
+    other.add_point(create_point(stamp=dt.datetime.now(), value=0))
+    assert other != dummy_goal
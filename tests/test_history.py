@@ -0,0 +1,75 @@
+import datetime as dt
+import subprocess
+import pytest
+from git import Repo
+from habit.goal import create_point
+from habit.store import DataStore
+from tests.test_goal import dummy_goal  # noqa: F401
+from tests.test_store import empty_folder  # noqa: F401
+
+
+def add_points(store, count):
+    """Add count points to Dummy, one commit each, return the commits."""
+    commits = []
+    for i in range(count):
+        store.load_goal('Dummy').add_point(
+            create_point(stamp=dt.datetime(2019, 6, 18 + i), value=i + 1))
+        commits.append(store.repo.head.commit)
+    return commits
+
+
+@pytest.fixture(params=[{}, {'journal': 10**6}, {'shard': True}],
+                ids=['plain', 'journal', 'shard'])
+def history_store(request, empty_folder, dummy_goal):
+    Repo.init(empty_folder)
+    store = DataStore(empty_folder, **request.param)
+    dummy_goal.set_store(store)
+    return store
+
+
+def test_goal_can_be_loaded_at_a_commit(history_store):
+    commits = add_points(history_store, 3)
+    goal = history_store.load_goal('Dummy', at=commits[1].hexsha)
+    assert [p.value for p in goal.datapoints] == [1, 2]
+    assert goal.store is None
+    goal = history_store.load_goal('Dummy', at='HEAD~2')
+    assert [p.value for p in goal.datapoints] == [1]
+    assert history_store.load_goal(
+        'Dummy', at='HEAD') == history_store.load_goal('Dummy')
+
+
+def test_past_goals_do_not_touch_the_working_tree(history_store):
+    add_points(history_store, 2)
+    before = subprocess.check_output(['git', 'status', '--porcelain'],
+                                     cwd=history_store.path)
+    history_store.load_goal('Dummy', at='HEAD~1')
+    assert subprocess.check_output(['git', 'status', '--porcelain'],
+                                   cwd=history_store.path) == before
+    assert len(history_store.load_goal('Dummy').datapoints) == 2
+
+
+def test_goal_can_be_loaded_at_a_datetime(history_store):
+    add_points(history_store, 1)
+    now = dt.datetime.now()
+    assert len(history_store.load_goal('Dummy', at=now).datapoints) == 1
+    with pytest.raises(ValueError):
+        history_store.load_goal('Dummy', at=now - dt.timedelta(days=1))
+
+
+def test_unknown_commits_and_goals_raise(history_store):
+    with pytest.raises(ValueError):
+        history_store.load_goal('Dummy', at='nonsense')
+    with pytest.raises(KeyError):
+        history_store.load_goal('Other', at='HEAD')
+
+
+def test_versions_are_streamed_and_parsed_once(history_store):
+    commits = add_points(history_store, 3)
+    history = history_store.history
+    versions = list(history_store.goal_versions('Dummy'))
+    assert [commit for commit, _ in versions[:3]] == commits[::-1]
+    assert [len(goal.datapoints) for _, goal in versions] == [3, 2, 1, 0]
+    parsed = len(history.objects)
+    assert list(history_store.goal_versions('Dummy', reverse=True)) == (
+        versions[::-1])
+    assert len(history.objects) == parsed
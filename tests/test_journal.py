@@ -0,0 +1,35 @@
+import pytest
+from habit.goal import create_point
+from habit.journal import Journal
+from tests.test_goal import dummy_goal, tmpfile  # noqa: F401
+import datetime as dt
+
+
+@pytest.fixture
+def journal(tmpfile):
+    return Journal(tmpfile)
+
+
+def test_journal_replays_changes(journal, dummy_goal):
+    point = create_point(stamp=dt.datetime(2019, 6, 18, 12), value=1)
+    other = create_point(stamp=dt.datetime(2019, 6, 19, 12), value=2)
+    edited = point._replace(value=3, comment='edited')
+    journal.append([('add', point), ('add', other)])
+    journal.append([('edit', edited), ('remove', other)])
+    journal.replay(dummy_goal)
+    assert dummy_goal.datapoints == (edited, )
+
+
+def test_cleared_journal_is_empty(journal):
+    journal.append([('add', create_point(value=1))])
+    assert journal.size() > 0
+    journal.clear()
+    assert journal.size() == 0
+    assert list(journal.changes()) == []
+
+
+def test_missing_journal_has_no_changes(journal):
+    journal.clear()
+    journal.path += '.missing'
+    assert journal.size() == 0
+    assert list(journal.changes()) == []
@@ -0,0 +1,100 @@
+import os
+import datetime as dt
+from habit.goal import Goal, create_point
+from habit.store import DataStore
+from tests.test_goal import dummy_goal  # noqa: F401
+from tests.test_store import (  # noqa: F401
+    empty_folder, empty_datastore, one_goal_datastore)
+
+
+def test_manifest_is_written_with_the_goal(one_goal_datastore):
+    assert os.path.exists(one_goal_datastore.manifest.path)
+    assert one_goal_datastore.manifest.names() == ['Dummy']
+    assert 'Dummy' in one_goal_datastore.manifest
+
+
+def test_summaries_do_not_load_unchanged_goals(one_goal_datastore):
+    goal = one_goal_datastore.load_goal('Dummy')
+    goal.add_point(create_point(value=3, stamp=dt.datetime.now()))
+    store = DataStore(one_goal_datastore.path)
+
+    def load_goals(names):
+        raise AssertionError('{} should not be loaded'.format(names))
+
+    summary, = store.manifest.summaries(load_goals)
+    assert summary.name == 'Dummy'
+    assert summary.value == 3
+    assert summary.pledge == goal.pledge
+    assert summary.active
+    now = dt.datetime.now()
+    assert summary.time_remaining(now) == goal.time_remaining(now)
+
+
+def test_manifest_picks_up_goals_written_by_others(one_goal_datastore,
+                                                   dummy_goal):
+    store = DataStore(one_goal_datastore.path)
+    store.list_goal_names()
+    other = Goal('Other', 5, dummy_goal.reference_points)
+    other.toYAML(os.path.join(store.path, 'Other.yaml'))
+    goal = Goal.fromYAML(store.get_path_to_goal('Dummy'))
+    goal.pledge = 7
+    goal.toYAML(store.get_path_to_goal('Dummy'), compact=True)
+    assert sorted(store.list_goal_names()) == ['Dummy', 'Other']
+    summaries = {s.name: s for s in store.goal_summaries()}
+    assert summaries['Other'].pledge == 5
+    assert summaries['Dummy'].pledge == 7
+
+
+def test_manifest_forgets_removed_goals(one_goal_datastore):
+    os.remove(one_goal_datastore.get_path_to_goal('Dummy'))
+    assert one_goal_datastore.list_goal_names() == []
+    assert not one_goal_datastore.has_goal('Dummy')
+
+
+def test_manifest_does_not_rescan_after_writes_of_the_store(
+        one_goal_datastore, dummy_goal):
+    store = DataStore(one_goal_datastore.path)
+    store.list_goal_names()
+
+    def scan():
+        raise AssertionError('The store directory should not be scanned')
+
+    store.manifest._scan = scan
+    goal = store.load_goal('Dummy')
+    goal.add_point(create_point(value=3, stamp=dt.datetime.now()))
+    Goal('Other', 5, dummy_goal.reference_points).set_store(store)
+    store.import_goals([Goal('Third', 1, dummy_goal.reference_points)],
+                       'Imported.')
+    assert sorted(store.list_goal_names()) == ['Dummy', 'Other', 'Third']
+    new_store = DataStore(store.path)
+    new_store.manifest._scan = scan
+    assert sorted(new_store.list_goal_names()) == ['Dummy', 'Other', 'Third']
+
+
+def test_manifest_keeps_goals_written_by_others_meanwhile(
+        one_goal_datastore, dummy_goal):
+    import threading
+    store = DataStore(one_goal_datastore.path)
+    other_store = DataStore(one_goal_datastore.path)
+    goal = store.load_goal('Dummy')
+    other = threading.Thread(target=Goal(
+        'Other', 5, dummy_goal.reference_points).set_store,
+                             args=(other_store, ))
+    with store.manifest.writing():
+        other.start()
+        other.join(0.2)
+        assert other.is_alive()
+        goal.add_point(create_point(value=3, stamp=dt.datetime.now()))
+    other.join()
+    new_store = DataStore(store.path)
+    assert sorted(new_store.list_goal_names()) == ['Dummy', 'Other']
+    assert new_store.load_goal('Other').pledge == 5
+
+
+def test_manifest_rescans_in_writing_blocks(one_goal_datastore, dummy_goal):
+    store = DataStore(one_goal_datastore.path)
+    store.list_goal_names()
+    Goal('Other', 5, dummy_goal.reference_points).toYAML(
+        os.path.join(store.path, 'Other.yaml'))
+    with store.manifest.writing():
+        assert 'Other' in store.manifest
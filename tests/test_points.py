@@ -0,0 +1,195 @@
+import pytest
+from habit.goal import create_point
+from habit.points import ColumnarPoints, FenwickTree, SortedPoints
+import datetime as dt
+
+
+@pytest.fixture
+def points():
+    now = dt.datetime(2019, 6, 18, 12)
+    return [
+        create_point(stamp=now + dt.timedelta(days=i), value=i)
+        for i in range(5)
+    ]
+
+
+def test_sorted_points_are_ordered_by_stamp(points):
+    sorted_points = SortedPoints(reversed(points))
+    assert sorted_points == tuple(points)
+
+
+def test_insert_keeps_points_ordered(points):
+    sorted_points = SortedPoints(points[::2])
+    sorted_points.insert(points[3])
+    sorted_points.insert(points[1])
+    assert sorted_points == tuple(points)
+    assert sorted_points.stamps == [p.stamp for p in points]
+
+
+def test_insert_appends_latest_point(points):
+    sorted_points = SortedPoints(points[:-1])
+    assert sorted_points.insert(points[-1]) == len(points) - 1
+    assert sorted_points[-1] == points[-1]
+
+
+def test_insert_places_points_with_equal_stamp_after_existing_ones(points):
+    sorted_points = SortedPoints(points)
+    same_stamp = create_point(stamp=points[2].stamp, value=100)
+    sorted_points.insert(same_stamp)
+    assert sorted_points[3] == same_stamp
+
+
+def test_remove_point(points):
+    sorted_points = SortedPoints(points)
+    sorted_points.remove(points[2])
+    assert points[2] not in sorted_points
+    assert len(sorted_points) == len(points) - 1
+    with pytest.raises(ValueError):
+        sorted_points.remove(points[2])
+
+
+def test_sorted_points_behave_like_a_tuple(points):
+    sorted_points = SortedPoints(points)
+    assert sorted_points[1:3] == tuple(points[1:3])
+    assert list(reversed(sorted_points)) == points[::-1]
+    assert hash(sorted_points) == hash(tuple(points))
+    assert SortedPoints(sorted_points) == sorted_points
+
+
+def test_find_points_by_uuid_prefix(points):
+    sorted_points = SortedPoints(points)
+    point = points[3]
+    assert sorted_points.find(point.uuid[:8]) == ([point], 1)
+    assert sorted_points.find('xyz') == ([], 0)
+
+
+def test_find_limits_the_returned_matches(points):
+    sorted_points = SortedPoints(points)
+    matches, count = sorted_points.find('', limit=2)
+    assert len(matches) == 2
+    assert count == len(points)
+
+
+def test_uuid_index_follows_inserts_and_removes(points):
+    sorted_points = SortedPoints(points[:-1])
+    sorted_points.find('')
+    sorted_points.insert(points[-1])
+    assert sorted_points.find(points[-1].uuid) == ([points[-1]], 1)
+    sorted_points.remove(points[0])
+    assert sorted_points.find(points[0].uuid) == ([], 0)
+    assert sorted_points.find('')[1] == len(points) - 1
+
+
+def test_fenwick_tree_prefix_sums():
+    values = [3, 1, 4, 1, 5, 9, 2, 6]
+    tree = FenwickTree(values[:5])
+    for value in values[5:]:
+        tree.append(value)
+    assert [tree.prefix_sum(i) for i in range(len(values) + 1)] == [
+        sum(values[:i]) for i in range(len(values) + 1)
+    ]
+    tree.add(2, 10)
+    assert tree.prefix_sum(3) == 18
+    assert tree.prefix_sum(8) == sum(values) + 10
+
+
+def test_total_follows_inserts_removes_and_replacements(points):
+    sorted_points = SortedPoints(points[1:])
+    assert sorted_points.total == 10
+    sorted_points.insert(points[0])
+    sorted_points.remove(points[4])
+    assert sorted_points.total == 6
+    sorted_points.replace(points[3], points[3]._replace(value=10))
+    assert sorted_points.total == 13
+
+
+def test_total_until_a_stamp(points):
+    sorted_points = SortedPoints(points[:3])
+    assert sorted_points.total_until(points[1].stamp) == 1
+    sorted_points.insert(points[4])
+    assert sorted_points.total_until(points[4].stamp) == 7
+    sorted_points.insert(points[3])
+    assert sorted_points.total_until(points[3].stamp) == 6
+    sorted_points.replace(points[0], points[0]._replace(value=5))
+    assert sorted_points.total_until(points[0].stamp) == 5
+    assert sorted_points.total_until(points[0].stamp -
+                                     dt.timedelta(seconds=1)) == 0
+
+
+@pytest.fixture
+def commented_points(points):
+    return [p._replace(comment='comment {}'.format(p.value)) if p.value % 2
+            else p for p in points]
+
+
+def test_columnar_points_equal_sorted_points(commented_points):
+    columnar = ColumnarPoints(reversed(commented_points))
+    assert columnar == SortedPoints(commented_points)
+    assert columnar == tuple(commented_points)
+    assert columnar[1:3] == tuple(commented_points[1:3])
+    assert columnar[-1] == commented_points[-1]
+
+
+def test_columnar_points_keep_microseconds(points):
+    point = points[0]._replace(stamp=points[0].stamp.replace(microsecond=7))
+    assert ColumnarPoints([point])[0] == point
+
+
+def test_columnar_points_support_the_sorted_points_operations(
+        commented_points):
+    columnar = ColumnarPoints(commented_points[:-1])
+    columnar.insert(commented_points[-1])
+    columnar.remove(commented_points[1])
+    edited = commented_points[3]._replace(value=10, comment='')
+    columnar.replace(commented_points[3], edited)
+    assert columnar == (commented_points[0], commented_points[2], edited,
+                        commented_points[4])
+    assert columnar.total == 16
+    assert columnar.total_until(commented_points[2].stamp) == 2
+    assert columnar.find(edited.uuid[:8]) == ([edited], 1)
+
+
+def test_columnar_points_copy_is_independent(points):
+    columnar = ColumnarPoints(points)
+    copy = ColumnarPoints(columnar)
+    copy.remove(points[0])
+    assert len(columnar) == len(points)
+    assert len(copy) == len(points) - 1
+
+
+@pytest.mark.parametrize('points_type', [SortedPoints, ColumnarPoints])
+def test_merge_inserts_points_in_order(points, points_type):
+    sorted_points = points_type(points[1::2])
+    sorted_points.find('')
+    same_stamp = create_point(stamp=points[1].stamp, value=10)
+    sorted_points.merge([points[4], same_stamp, points[0], points[2]])
+    assert sorted_points == (points[0], points[1], same_stamp, points[2],
+                             points[3], points[4])
+    assert sorted_points.total == 20
+    assert sorted_points.find(same_stamp.uuid) == ([same_stamp], 1)
+
+
+@pytest.mark.parametrize('points_type', [SortedPoints, ColumnarPoints])
+def test_between_returns_the_points_in_a_stamp_range(points, points_type):
+    sorted_points = points_type(points)
+    assert tuple(sorted_points.between(points[1].stamp,
+                                       points[3].stamp)) == tuple(points[1:4])
+    assert tuple(sorted_points.between(since=points[3].stamp)) == tuple(
+        points[3:])
+    assert tuple(sorted_points.between(until=points[0].stamp)) == (
+        points[0], )
+    assert tuple(sorted_points.between(points[3].stamp,
+                                       points[1].stamp)) == ()
+
+
+@pytest.mark.parametrize('points_type', [SortedPoints, ColumnarPoints])
+def test_page_skips_and_limits_the_points(points, points_type):
+    sorted_points = points_type(points)
+    assert tuple(sorted_points.page()) == tuple(points)
+    assert tuple(sorted_points.page(offset=1, limit=2)) == tuple(points[1:3])
+    assert tuple(sorted_points.page(reverse=True, limit=2)) == (points[-1],
+                                                               points[-2])
+    assert tuple(
+        sorted_points.page(points[1].stamp, points[3].stamp, offset=1,
+                           reverse=True)) == (points[2], points[1])
+    assert tuple(sorted_points.page(offset=len(points))) == ()
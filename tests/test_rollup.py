@@ -0,0 +1,77 @@
+import datetime as dt
+import pytest
+from habit.goal import Goal, create_point
+from habit.points import ColumnarPoints, SortedPoints
+from habit.rollup import _rollup_points, rollup
+from habit.schedule import Schedule
+
+
+@pytest.fixture
+def goal():
+    reference_points = (
+        create_point(stamp=dt.datetime(2019, 6, 1), value=0),
+        create_point(stamp=dt.datetime(2019, 7, 1), value=30),
+    )
+    points = [
+        create_point(stamp=dt.datetime(2019, 6, 17, 8), value=1),
+        create_point(stamp=dt.datetime(2019, 6, 17, 20), value=3),
+        create_point(stamp=dt.datetime(2019, 6, 19, 12), value=2),
+        create_point(stamp=dt.datetime(2019, 6, 24, 12), value=4),
+        create_point(stamp=dt.datetime(2019, 7, 2, 12), value=5),
+    ]
+    return Goal(
+        name='Rollup',
+        pledge=0,
+        reference_points=reference_points,
+        datapoints=points)
+
+
+def test_daily_rollup(goal):
+    rollups = goal.rollup('day')
+    assert rollups[0].start == dt.date(2019, 6, 17)
+    assert rollups[-1].start == dt.date(2019, 7, 2)
+    assert len(rollups) == 16
+    assert rollups[0][1:] == (2, 4, 2, 4, 17)
+    assert rollups[1][1:] == (0, 0, None, 4, 18)
+    assert rollups[2].cumulative == 6
+    assert rollups[-1].target is None
+    assert rollups[-1].cumulative == goal.value()
+
+
+def test_weekly_rollup_starts_on_mondays(goal):
+    rollups = goal.rollup('week')
+    assert [r.start for r in rollups] == [
+        dt.date(2019, 6, 17),
+        dt.date(2019, 6, 24),
+        dt.date(2019, 7, 1)
+    ]
+    assert [r.count for r in rollups] == [3, 1, 1]
+    assert [r.sum for r in rollups] == [6, 4, 5]
+    assert rollups[0].mean == 2
+    assert rollups[0].target == 23
+
+
+def test_monthly_rollup(goal):
+    rollups = goal.rollup('month')
+    assert [(r.start, r.count, r.sum, r.cumulative) for r in rollups] == [
+        (dt.date(2019, 6, 1), 4, 10, 10),
+        (dt.date(2019, 7, 1), 1, 5, 15),
+    ]
+    assert rollups[0].target == 30
+    assert rollups[1].target is None
+
+
+def test_rollup_of_no_points_and_unknown_periods(goal):
+    assert Goal(name='Empty', pledge=0, reference_points=()).rollup() == []
+    with pytest.raises(ValueError):
+        goal.rollup('year')
+
+
+@pytest.mark.parametrize('by', ['day', 'week', 'month'])
+@pytest.mark.parametrize('container', [SortedPoints, ColumnarPoints])
+def test_vectorized_rollup_matches_the_fallback(goal, by, container):
+    pytest.importorskip('numpy')
+    points = container(goal.datapoints)
+    schedule = Schedule(goal.reference_points)
+    assert rollup(points, by, schedule) == _rollup_points(
+        points, by, schedule)
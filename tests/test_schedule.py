@@ -0,0 +1,75 @@
+import pytest
+from habit.goal import create_point
+from habit.schedule import Schedule
+import datetime as dt
+
+
+@pytest.fixture
+def start():
+    return dt.datetime(2019, 6, 18, 12)
+
+
+@pytest.fixture
+def schedule(start):
+    return Schedule((
+        create_point(stamp=start, value=0),
+        create_point(stamp=start + dt.timedelta(days=10), value=10),
+        create_point(stamp=start + dt.timedelta(days=20), value=30),
+    ))
+
+
+def test_schedule_has_one_segment_per_pair_of_reference_points(schedule):
+    assert len(schedule) == 2
+
+
+def test_segment_is_found_by_time(schedule, start):
+    assert schedule.segment(start) == 0
+    assert schedule.segment(start + dt.timedelta(days=10)) == 0
+    assert schedule.segment(start + dt.timedelta(days=11)) == 1
+    assert schedule.segment(start + dt.timedelta(days=21)) is None
+
+
+def test_time_remaining_on_each_segment(schedule, start):
+    assert schedule.time_remaining(5, start) == dt.timedelta(days=5)
+    now = start + dt.timedelta(days=12)
+    assert schedule.time_remaining(20, now) == dt.timedelta(days=3)
+    assert schedule.time_remaining(20, start + dt.timedelta(days=21)) is None
+
+
+def test_time_remaining_is_chopped_to_seconds(schedule, start):
+    now = start + dt.timedelta(microseconds=1)
+    assert schedule.time_remaining(5, now) == dt.timedelta(
+        days=5) - dt.timedelta(seconds=1)
+
+
+def test_time_remaining_many_matches_single_evaluation(schedule, start):
+    numpy = pytest.importorskip('numpy')
+    nows = [start + dt.timedelta(hours=7 * i) for i in range(80)]
+    values = [i / 3 for i in range(80)]
+    result = schedule.time_remaining_many(values, nows)
+    for value, now, delta in zip(values, nows, result):
+        expected = schedule.time_remaining(value, now)
+        if expected is None:
+            assert numpy.isnat(delta)
+        else:
+            assert delta.astype(dt.timedelta) == expected
+
+
+def test_value_follows_the_line(schedule, start):
+    assert schedule.value(start) == 0
+    assert schedule.value(start + dt.timedelta(days=5)) == 5
+    assert schedule.value(start + dt.timedelta(days=15)) == 20
+    assert schedule.value(start + dt.timedelta(days=20)) == 30
+    assert schedule.value(start - dt.timedelta(days=1)) is None
+    assert schedule.value(start + dt.timedelta(days=21)) is None
+
+
+def test_value_many_matches_single_evaluation(schedule, start):
+    numpy = pytest.importorskip('numpy')
+    nows = [start + dt.timedelta(hours=7 * i) for i in range(-5, 80)]
+    for now, value in zip(nows, schedule.value_many(nows)):
+        expected = schedule.value(now)
+        if expected is None:
+            assert numpy.isnan(value)
+        else:
+            assert value == pytest.approx(expected)
@@ -0,0 +1,166 @@
+import datetime as dt
+import os
+import pickle
+import pytest
+from habit.goal import Goal, create_point
+from habit.sqlstore import SQLITE_FILENAME, SQLitePoints, SQLiteStore
+from habit.store import DataStore, load_store, migrate
+from tests.test_goal import dummy_goal  # noqa: F401
+from tests.test_store import empty_folder  # noqa: F401
+
+
+@pytest.fixture
+def sqlite_store(empty_folder):
+    return SQLiteStore.init(empty_folder)
+
+
+@pytest.fixture
+def stored_goal(sqlite_store, dummy_goal):
+    now = dt.datetime(2019, 6, 18, 12)
+    for i in range(5):
+        dummy_goal.add_point(
+            create_point(stamp=now + dt.timedelta(days=i), value=i))
+    dummy_goal.set_store(sqlite_store)
+    return sqlite_store.load_goal(dummy_goal.name)
+
+
+def test_init_creates_the_database(empty_folder):
+    SQLiteStore.init(empty_folder)
+    assert os.path.isfile(os.path.join(empty_folder, SQLITE_FILENAME))
+    with pytest.raises(FileExistsError):
+        SQLiteStore.init(empty_folder)
+
+
+def test_store_requires_a_database(empty_folder):
+    with pytest.raises(FileNotFoundError):
+        SQLiteStore(empty_folder)
+
+
+def test_load_store_picks_the_backend(sqlite_store, empty_folder):
+    assert isinstance(load_store(sqlite_store.path), SQLiteStore)
+    DataStore.init(os.path.join(empty_folder, 'git'))
+    assert isinstance(
+        load_store(os.path.join(empty_folder, 'git')), DataStore)
+
+
+def test_added_goal_can_be_loaded(sqlite_store, dummy_goal, stored_goal):
+    assert sqlite_store.list_goal_names() == ['Dummy']
+    assert sqlite_store.has_goal('Dummy')
+    assert isinstance(stored_goal.datapoints, SQLitePoints)
+    assert stored_goal == dummy_goal
+    with pytest.raises(KeyError):
+        sqlite_store.load_goal('Missing')
+
+
+def test_goal_with_existing_name_cannot_be_added(sqlite_store, stored_goal):
+    with pytest.raises(ValueError):
+        stored_goal.copy().set_store(sqlite_store)
+
+
+def test_point_changes_are_written_to_the_database(sqlite_store,
+                                                   stored_goal):
+    first, second = stored_goal.datapoints[:2]
+    point = create_point(stamp=dt.datetime(2019, 6, 1), value=10)
+    stored_goal.add_point(point)
+    stored_goal.remove_point(second.uuid)
+    stored_goal.edit_point(first.uuid, value=3, comment='edited')
+    goal = SQLiteStore(sqlite_store.path).load_goal('Dummy')
+    assert goal.datapoints[0] == point
+    assert goal.datapoints[1] == first._replace(value=3, comment='edited')
+    assert second not in goal.datapoints
+    assert len(goal.datapoints) == 5
+    assert goal.value() == 10 + 3 + 2 + 3 + 4
+
+
+def test_changes_of_goals_from_elsewhere_are_applied(sqlite_store,
+                                                     dummy_goal):
+    dummy_goal.set_store(sqlite_store)
+    point = create_point(stamp=dt.datetime(2019, 6, 1), value=10)
+    dummy_goal.add_point(point)
+    dummy_goal.edit_point(point.uuid, value=5)
+    assert sqlite_store.load_goal('Dummy') == dummy_goal
+
+
+def test_points_are_queried_from_the_database(stored_goal):
+    points = stored_goal.datapoints
+    assert len(points) == 5
+    assert points[-1].value == 4
+    assert list(reversed(points)) == list(points)[::-1]
+    assert stored_goal.value(at=points[2].stamp) == 0 + 1 + 2
+    assert tuple(points.between(points[1].stamp,
+                                points[3].stamp)) == points[1:4]
+    assert points.index(points[3]) == 3
+    matches, count = points.find(points[4].uuid[:6])
+    assert count == 1 and matches == [points[4]]
+    assert stored_goal.find_datapoint(points[4].uuid[:6]) == points[4]
+
+
+def test_pages_are_queried_from_the_database(stored_goal):
+    points = stored_goal.datapoints
+    assert tuple(points.page(offset=1, limit=2)) == points[1:3]
+    assert tuple(points.page(points[1].stamp, reverse=True,
+                             limit=2)) == (points[4], points[3])
+
+
+def test_points_are_read_as_columns(stored_goal):
+    pytest.importorskip('numpy')
+    stamps, values = stored_goal.datapoints.columns()
+    assert stamps.tolist() == list(stored_goal.datapoints.stamps)
+    assert values.tolist() == [0, 1, 2, 3, 4]
+    assert [r.sum for r in stored_goal.rollup('day')] == [0, 1, 2, 3, 4]
+
+
+def test_equal_stamps_keep_their_insertion_order(stored_goal):
+    stamp = stored_goal.datapoints[1].stamp
+    point = create_point(stamp=stamp, value=7)
+    stored_goal.add_point(point)
+    assert stored_goal.datapoints[2] == point
+
+
+def test_rollback_drops_the_changes(sqlite_store, stored_goal):
+    point = create_point(stamp=dt.datetime(2019, 6, 1), value=10)
+    with pytest.raises(RuntimeError):
+        with stored_goal.batch():
+            stored_goal.add_point(point)
+            assert sqlite_store.pending == 1
+            raise RuntimeError()
+    assert point not in stored_goal.datapoints
+    assert stored_goal.value() == 10
+
+
+def test_goal_summaries(sqlite_store, stored_goal):
+    summary, = sqlite_store.goal_summaries()
+    assert summary.name == 'Dummy'
+    assert summary.value == 10
+    assert summary.reference_points == stored_goal.reference_points
+
+
+def test_goals_from_the_database_can_be_pickled(stored_goal):
+    goal = pickle.loads(pickle.dumps(stored_goal))
+    assert goal.store is None
+    assert goal == stored_goal
+
+
+def test_migration_in_both_directions(sqlite_store, stored_goal,
+                                      empty_folder):
+    git_store = DataStore.init(os.path.join(empty_folder, 'git'))
+    assert migrate(sqlite_store, git_store) == 1
+    assert git_store.load_goal('Dummy') == stored_goal
+    assert 'Migrated goals' in git_store.repo.head.commit.message
+    back = SQLiteStore.init(os.path.join(empty_folder, 'back'))
+    assert migrate(git_store, back) == 1
+    assert back.load_goal('Dummy') == stored_goal
+    with pytest.raises(ValueError):
+        migrate(git_store, back)
+    assert back.list_goal_names() == ['Dummy']
+
+
+def test_goal_attributes_are_updated(sqlite_store, stored_goal):
+    stored_goal.pledge = 5
+    stored_goal.add_reference_point(
+        create_point(stamp=dt.datetime(2030, 1, 1), value=100))
+    stored_goal.add_point(create_point(value=1))
+    goal = sqlite_store.load_goal('Dummy')
+    assert goal.pledge == 5
+    assert isinstance(goal, Goal)
+    assert goal.reference_points == stored_goal.reference_points
@@ -10,7 +10,7 @@ from git.exc import InvalidGitRepositoryError
 from tests.test_goal import dummy_goal
 
 from habit.store import DataStore
-from habit.goal import create_point
+from habit.goal import Goal, create_point
 import datetime as dt
 
 
@@ -142,3 +142,311 @@ def test_store_makes_commit_when_goal_edits_a_datapoint(one_goal_datastore):
     new_head_commit = one_goal_datastore.repo.head.commit
     assert old_head_commit != new_head_commit
     assert new_head_commit.parents[0] == old_head_commit
+
+
+def test_store_writes_compact_goals_when_configured(one_goal_datastore):
+    with one_goal_datastore.repo.config_writer() as config:
+        config.set_value('habit', 'compact', True)
+    store = DataStore(one_goal_datastore.path)
+    assert store.compact
+    goal = store.load_goal('Dummy')
+    point = create_point(value=1, stamp=dt.datetime(2019, 6, 18))
+    goal.add_point(point)
+    with open(store.get_path_to_goal('Dummy')) as f:
+        assert '- [1560816000, 1, \'\', {}]'.format(point.uuid) in f.read()
+    assert store.load_goal('Dummy').datapoints[0] == point
+
+
+@pytest.fixture
+def journal_datastore(one_goal_datastore):
+    return DataStore(one_goal_datastore.path, journal=1000)
+
+
+def test_store_appends_changes_to_the_journal(journal_datastore):
+    goal = journal_datastore.load_goal('Dummy')
+    snapshot = journal_datastore.get_path_to_goal('Dummy')
+    with open(snapshot) as f:
+        before = f.read()
+    point = create_point(value=1, stamp=dt.datetime.now())
+    goal.add_point(point)
+    goal.edit_point(point.uuid, value=2)
+    with open(snapshot) as f:
+        assert f.read() == before
+    assert journal_datastore.get_journal('Dummy').size() > 0
+    assert not journal_datastore.repo.is_dirty(untracked_files=True)
+    assert journal_datastore.load_goal('Dummy') == goal
+
+
+def test_store_folds_a_full_journal_into_the_goal_file(journal_datastore):
+    goal = journal_datastore.load_goal('Dummy')
+    for i in range(20):
+        goal.add_point(create_point(value=i, stamp=dt.datetime.now()))
+    journal = journal_datastore.get_journal('Dummy')
+    assert journal.size() < journal_datastore.journal
+    assert len(journal_datastore.load_goal('Dummy').datapoints) == 20
+    assert not journal_datastore.repo.is_dirty(untracked_files=True)
+
+
+def test_store_writes_other_changes_next_to_the_journal(journal_datastore):
+    goal = journal_datastore.load_goal('Dummy')
+    goal.pledge = 10
+    goal.add_point(create_point(value=1, stamp=dt.datetime.now()))
+    assert not goal.meta_dirty
+    assert Goal.fromYAML(
+        journal_datastore.get_path_to_goal('Dummy')).pledge == 10
+    assert journal_datastore.load_goal('Dummy').pledge == 10
+    assert DataStore(journal_datastore.path).load_goal('Dummy').pledge == 10
+    goal.add_point(create_point(value=2, stamp=dt.datetime.now()))
+    assert journal_datastore.get_journal('Dummy').size() > 0
+
+
+def test_transaction_makes_a_single_commit(one_goal_datastore, dummy_goal):
+    old_head_commit = one_goal_datastore.repo.head.commit
+    goal = one_goal_datastore.load_goal('Dummy')
+    with one_goal_datastore.transaction():
+        for i in range(3):
+            goal.add_point(create_point(value=i, stamp=dt.datetime.now()))
+        other = Goal('Other', 1, dummy_goal.reference_points)
+        other.set_store(one_goal_datastore)
+        assert one_goal_datastore.repo.head.commit == old_head_commit
+        assert one_goal_datastore.load_goal('Dummy') is goal
+    new_head_commit = one_goal_datastore.repo.head.commit
+    assert new_head_commit.parents[0] == old_head_commit
+    assert new_head_commit.message.startswith('4 changes')
+    assert not one_goal_datastore.repo.is_dirty(untracked_files=True)
+    assert len(one_goal_datastore.load_goal('Dummy').datapoints) == 3
+    assert sorted(one_goal_datastore.list_goal_names()) == ['Dummy', 'Other']
+
+
+def test_transaction_keeps_changes_made_through_several_objects(
+        one_goal_datastore):
+    with one_goal_datastore.transaction():
+        first = one_goal_datastore.load_goal('Dummy')
+        second = one_goal_datastore.load_goal('Dummy')
+        first.add_point(
+            create_point(value=1, stamp=dt.datetime.now(), comment='one'))
+        second.add_point(
+            create_point(value=2, stamp=dt.datetime.now(), comment='two'))
+    stored = DataStore(one_goal_datastore.path).load_goal('Dummy')
+    assert sorted(p.comment for p in stored.datapoints) == ['one', 'two']
+
+
+def test_failed_transaction_writes_nothing(one_goal_datastore):
+    old_head_commit = one_goal_datastore.repo.head.commit
+    goal = one_goal_datastore.load_goal('Dummy')
+    with pytest.raises(RuntimeError):
+        with one_goal_datastore.transaction():
+            goal.add_point(create_point(value=1, stamp=dt.datetime.now()))
+            raise RuntimeError()
+    assert one_goal_datastore.repo.head.commit == old_head_commit
+    assert not one_goal_datastore.repo.is_dirty(untracked_files=True)
+    assert len(one_goal_datastore.load_goal('Dummy').datapoints) == 0
+
+
+def test_goal_batch_makes_a_single_commit(journal_datastore):
+    old_head_commit = journal_datastore.repo.head.commit
+    goal = journal_datastore.load_goal('Dummy')
+    with goal.batch():
+        point = create_point(value=1, stamp=dt.datetime.now())
+        goal.add_point(point)
+        goal.edit_point(point.uuid, value=2)
+    assert journal_datastore.repo.head.commit.parents[0] == old_head_commit
+    assert journal_datastore.load_goal('Dummy') == goal
+
+
+def test_store_serves_updated_goals_from_the_cache(one_goal_datastore):
+    goal = one_goal_datastore.load_goal('Dummy')
+    goal.add_point(create_point(value=1, stamp=dt.datetime.now()))
+    loaded = one_goal_datastore.load_goal('Dummy')
+    assert loaded == goal
+    assert loaded is not goal
+    assert loaded.store is one_goal_datastore
+    cache = os.path.join(one_goal_datastore.repo.git_dir, 'habit-cache')
+    assert not os.path.exists(cache)
+    assert DataStore(one_goal_datastore.path).load_goal('Dummy') == goal
+    assert len(os.listdir(cache)) == 1
+
+
+def test_store_loads_goals_in_parallel(empty_datastore, dummy_goal,
+                                       monkeypatch):
+    monkeypatch.setattr('habit.store.PARALLEL_LOAD_THRESHOLD', 2)
+    names = ['Goal{}'.format(i) for i in range(5)]
+    with empty_datastore.transaction():
+        for name in names:
+            Goal(name, 0, dummy_goal.reference_points).set_store(
+                empty_datastore)
+    goals = list(empty_datastore.load_goals(names[::-1], processes=2))
+    assert [goal.name for goal in goals] == names[::-1]
+    assert all(goal.store is empty_datastore for goal in goals)
+    assert goals[0] == empty_datastore.load_goal(names[-1])
+
+
+def test_parallel_loads_use_the_options_of_the_store(empty_datastore,
+                                                     dummy_goal, monkeypatch):
+    monkeypatch.setattr('habit.store.PARALLEL_LOAD_THRESHOLD', 2)
+    store = DataStore(empty_datastore.path, cache=False)
+    names = ['Goal{}'.format(i) for i in range(5)]
+    with store.transaction():
+        for name in names:
+            Goal(name, 0, dummy_goal.reference_points).set_store(store)
+    assert len(list(store.load_goals(names, processes=2))) == 5
+    assert not os.path.exists(os.path.join(store.git_dir, 'habit-cache'))
+
+
+@pytest.fixture
+def sharded_datastore(empty_datastore, dummy_goal):
+    store = DataStore(empty_datastore.path, shard=True)
+    for month in (5, 6):
+        dummy_goal.add_point(
+            create_point(value=month, stamp=dt.datetime(2019, month, 18)))
+    dummy_goal.set_store(store)
+    return store
+
+
+def test_sharded_goals_are_split_by_month(sharded_datastore, dummy_goal):
+    directory = sharded_datastore.get_shard_directory('Dummy')
+    assert sorted(os.listdir(directory)) == [
+        '2019-05.yaml', '2019-06.yaml', 'meta.yaml'
+    ]
+    assert sharded_datastore.list_goal_names() == ['Dummy']
+    assert not sharded_datastore.repo.is_dirty(untracked_files=True)
+    assert DataStore(sharded_datastore.path).load_goal('Dummy') == dummy_goal
+
+
+def test_changes_rewrite_only_their_shard(sharded_datastore):
+    goal = sharded_datastore.load_goal('Dummy')
+    goal.add_point(create_point(value=1, stamp=dt.datetime(2019, 6, 20)))
+    commit = sharded_datastore.repo.head.commit
+    changed = set(commit.stats.files)
+    assert changed == {'Dummy/2019-06.yaml'}
+    goal.edit_point(goal.datapoints[0].uuid, stamp=dt.datetime(2019, 7, 1))
+    changed = set(sharded_datastore.repo.head.commit.stats.files)
+    assert changed == {'Dummy/2019-05.yaml', 'Dummy/2019-07.yaml'}
+    assert not sharded_datastore.repo.is_dirty(untracked_files=True)
+    assert DataStore(sharded_datastore.path).load_goal('Dummy') == goal
+
+
+def test_sharded_goal_can_be_loaded_for_a_time_range(sharded_datastore):
+    goal = sharded_datastore.load_goal(
+        'Dummy', since=dt.datetime(2019, 6, 1))
+    assert [p.value for p in goal.datapoints] == [6]
+    assert goal.store is None
+
+
+def test_changes_without_effect_are_not_written(one_goal_datastore):
+    goal = one_goal_datastore.load_goal('Dummy')
+    point = create_point(value=1, stamp=dt.datetime.now())
+    goal.add_point(point)
+    assert not goal.dirty
+    old_head_commit = one_goal_datastore.repo.head.commit
+    goal.edit_point(point.uuid)
+    goal.edit_point(point.uuid, value=1, comment='')
+    assert one_goal_datastore.repo.head.commit == old_head_commit
+
+
+def test_importing_no_points_writes_nothing(one_goal_datastore):
+    store = DataStore(one_goal_datastore.path, fastcommit=False)
+    old_head_commit = store.repo.head.commit
+    goal = store.load_goal('Dummy')
+    goal.add_points([])
+    assert not goal.dirty
+    assert store.repo.head.commit == old_head_commit
+
+
+def test_deferred_changes_are_written_with_one_commit(one_goal_datastore,
+                                                      monkeypatch):
+    registered = []
+    monkeypatch.setattr('atexit.register', registered.append)
+    monkeypatch.setattr('atexit.unregister', registered.remove)
+    old_head_commit = one_goal_datastore.repo.head.commit
+    goal = one_goal_datastore.load_goal('Dummy')
+    goal.defer()
+    assert registered == [goal.flush]
+    for i in range(3):
+        goal.add_point(create_point(value=i, stamp=dt.datetime.now()))
+    goal.pledge = 10
+    assert goal.dirty
+    assert one_goal_datastore.repo.head.commit == old_head_commit
+    goal.flush()
+    assert not goal.dirty
+    new_head_commit = one_goal_datastore.repo.head.commit
+    assert new_head_commit.parents[0] == old_head_commit
+    assert new_head_commit.message.startswith('Goal Dummy: 3 changes')
+    assert one_goal_datastore.load_goal('Dummy') == goal
+    goal.add_point(create_point(value=5, stamp=dt.datetime.now()))
+    goal.defer(False)
+    assert registered == []
+    assert one_goal_datastore.repo.head.commit.parents[0] == new_head_commit
+    assert len(one_goal_datastore.load_goal('Dummy').datapoints) == 4
+
+
+def test_concurrent_changes_are_rebased(one_goal_datastore):
+    first = one_goal_datastore.load_goal('Dummy')
+    second = DataStore(one_goal_datastore.path).load_goal('Dummy')
+    first_point = create_point(value=1, stamp=dt.datetime(2019, 6, 18))
+    second_point = create_point(value=2, stamp=dt.datetime(2019, 6, 17))
+    first.add_point(first_point)
+    second.add_point(second_point)
+    assert second.datapoints == (second_point, first_point)
+    assert not one_goal_datastore.repo.is_dirty(untracked_files=True)
+    loaded = DataStore(one_goal_datastore.path).load_goal('Dummy')
+    assert loaded == second
+
+
+def test_rebase_keeps_concurrent_changes_of_the_pledge(one_goal_datastore):
+    first = one_goal_datastore.load_goal('Dummy')
+    second = DataStore(one_goal_datastore.path).load_goal('Dummy')
+    second.pledge = 50
+    second.active = False
+    second.add_point(create_point(value=2, stamp=dt.datetime(2019, 6, 17)))
+    first.add_point(create_point(value=1, stamp=dt.datetime(2019, 6, 18)))
+    assert first.pledge == 50
+    assert not first.active
+    loaded = DataStore(one_goal_datastore.path).load_goal('Dummy')
+    assert loaded.pledge == 50
+    assert not loaded.active
+    assert len(loaded.datapoints) == 2
+
+
+def test_concurrent_changes_of_the_pledge_fail(one_goal_datastore):
+    first = one_goal_datastore.load_goal('Dummy')
+    second = DataStore(one_goal_datastore.path).load_goal('Dummy')
+    first.add_point(create_point(value=1, stamp=dt.datetime(2019, 6, 18)))
+    second.pledge = 10
+    with pytest.raises(RuntimeError):
+        second.add_point(
+            create_point(value=2, stamp=dt.datetime(2019, 6, 17)))
+
+
+def test_concurrent_full_writes_fail(one_goal_datastore):
+    first = one_goal_datastore.load_goal('Dummy')
+    second = DataStore(one_goal_datastore.path).load_goal('Dummy')
+    first.add_point(create_point(value=1, stamp=dt.datetime(2019, 6, 18)))
+    second.pledge = 10
+    with pytest.raises(RuntimeError):
+        second.flush()
+
+
+def _add_points(path, name, count):
+    store = DataStore(path)
+    for i in range(count):
+        store.load_goal(name).add_point(
+            create_point(value=1, stamp=dt.datetime(2019, 6, 18)))
+
+
+def test_parallel_writers_lose_no_points(one_goal_datastore):
+    import multiprocessing
+    processes = [
+        multiprocessing.Process(
+            target=_add_points, args=(one_goal_datastore.path, 'Dummy', 5))
+        for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+    goal = DataStore(one_goal_datastore.path).load_goal('Dummy')
+    assert len(goal.datapoints) == 20
+    assert not one_goal_datastore.repo.is_dirty(untracked_files=True)
+    assert len(list(one_goal_datastore.repo.iter_commits())) == 21